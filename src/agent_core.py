@@ -3,78 +3,331 @@ Core Dental Agent module for the Dental Agent Prototype.
 This class orchestrates all the interactions between different handlers.
 """
 
-from typing import Dict, Any
+import contextvars
+import dataclasses
+import datetime
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, Optional, Set, Tuple
+
+from message_templates import render
+from patient_directory import get_patient_directory
+from profiler import profiled, span
+from records import Conversation, Delivery, Patient, Turn
+from single_flight import make_key
+from slot_prefetch import (AvailabilitySnapshot, SlotPrefetcher, describe_slot, parse_practice_time,
+                           snapshot_from, APPOINTMENT_DURATION_MINUTES)
+from slot_reservations import to_epoch
+
+# How long an availability check waits for an in-flight prefetch before asking the scheduler itself.
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "2"))
+MAX_CONVERSATIONS = int(os.getenv("MAX_CONVERSATIONS", "1000"))
+# Threads for steps run alongside the turn (patient lookup) and for outbound sends, which are kept
+# on their own pool so a slow email provider cannot hold up lookups.
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "8"))
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", "4"))
 
 class DentalAgent:
-    def __init__(self, llm_handler, scheduler_handler, comm_handler):
+    def __init__(self, llm_handler, scheduler_handler, comm_handler, patient_directory=None):
         self.llm_handler = llm_handler
         self.scheduler_handler = scheduler_handler
         self.comm_handler = comm_handler
+        # Defaults to the process-wide directory, created on the first inbound communication.
+        self.patient_directory = patient_directory
+        self.slot_prefetcher = SlotPrefetcher(scheduler_handler)
+        self.conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        # Turns arrive on several server threads at once; reentrant so conversation_for can start one.
+        self._conversations_lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=AGENT_WORKERS, thread_name_prefix="dental-agent")
+        self._delivery_executor = ThreadPoolExecutor(max_workers=DELIVERY_WORKERS, thread_name_prefix="delivery")
+        self._deliveries_lock = threading.Lock()
+        self._pending_deliveries: Set[Future] = set()
+        self._delivery_counts = {"sent": 0, "failed": 0}
         print("DentalAgent initialized with all handlers.")
 
+    def start_conversation(self, conversation_id: str) -> Conversation:
+        """Create the state for a new call or thread and start prefetching availability for it."""
+        conversation = Conversation(conversation_id, slot_prefetch=self.slot_prefetcher.prefetch())
+        with self._conversations_lock:
+            self.conversations[conversation_id] = conversation
+            while len(self.conversations) > MAX_CONVERSATIONS:
+                self.conversations.popitem(last=False)
+        return conversation
+
+    def conversation_for(self, conversation_id: str) -> Conversation:
+        """The state for a call or thread, started on its first turn."""
+        with self._conversations_lock:
+            return self.conversations.get(conversation_id) or self.start_conversation(conversation_id)
+
+    def end_conversation(self, conversation_id: str) -> None:
+        with self._conversations_lock:
+            self.conversations.pop(conversation_id, None)
+
     def greet_caller(self) -> str:
-        message = "Hello! This is the Dental Agent prototype. How can I assist you today?"
+        message = render("greeting")
         print(f"Agent: {message}")
         return message
 
+    @profiled("agent.resolve_patient")
+    def resolve_patient(self, contact: Optional[str]) -> Optional[Patient]:
+        """Match a caller ID or sender address to a directory patient and their upcoming appointments."""
+        if self.patient_directory is None:
+            self.patient_directory = get_patient_directory()
+        patient = self.patient_directory.lookup_contact(contact)
+        if not patient:
+            print(f"DentalAgent: No patient on file for {contact}.")
+            return None
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        # A copy, so the directory's shared record does not hold per-conversation appointments.
+        patient = dataclasses.replace(
+            patient, upcoming_appointments=self.scheduler_handler.list_patient_appointments(patient, now)
+        )
+        print(f"DentalAgent: Matched {contact} to patient {patient.patient_id} "
+              f"with {len(patient.upcoming_appointments)} upcoming appointment(s).")
+        return patient
+
+    @profiled("agent.turn")
     def process_inbound_communication(self, communication_input: dict):
         print(f"DentalAgent: Processing inbound communication: {communication_input}")
+        contact = communication_input.get('contact') or communication_input.get('caller_id')
+        conversation_id = communication_input.get('call_sid') or contact
+        # Starting the conversation kicks off the availability prefetch, which then runs
+        # alongside patient lookup and intent detection instead of after them.
+        conversation = self.conversation_for(conversation_id)
         user_utterance = communication_input.get('message') or communication_input.get('initial_utterance')
-        intent_data = self.llm_handler.understand_intent(user_utterance)
+        turn = Turn(time.time(), user_utterance)
+        conversation.turns.append(turn)
+        # Patient lookup and intent detection do not depend on each other, so the directory and
+        # scheduler lookups run while the LLM works out the intent. The copied context carries an
+        # active profile over to the worker thread.
+        patient_lookup = self._executor.submit(contextvars.copy_context().run, self.resolve_patient, contact)
+        with span("agent.understand_intent"):
+            intent_data = self.llm_handler.understand_intent(user_utterance)
+        turn.intent = intent_data.get('intent')
         print(f"DentalAgent: Understood intent: {intent_data}")
+        try:
+            patient = patient_lookup.result()
+        except Exception as e:
+            # The lookup only enriches the turn; answer without it rather than leave the patient unanswered.
+            print(f"DentalAgent: Patient lookup for {contact} failed, continuing without it: {e}")
+            patient = None
+        communication_input['patient'] = conversation.patient = patient
 
         if intent_data['intent'] == 'schedule_appointment':
-            self.request_schedule_appointment(intent_data.get('entities', {}))
+            entities = intent_data.get('entities', {})
+            # Replies go back to the channel the patient reached us on, not a placeholder.
+            entities.setdefault('contact_info', contact)
+            if patient:
+                entities.setdefault('patient_name', patient.name)
+            # The channel's message ID makes redelivered webhooks safe to process twice. One call has
+            # many turns, so the key also covers the requested slot and patient: a later request in
+            # the same call must book afresh rather than replay the first booking.
+            request_id = communication_input.get('message_id') or communication_input.get('call_sid')
+            idempotency_key = request_id and make_key(
+                request_id, "book", entities.get('time'), entities.get('end_time'), entities.get('contact_info')
+            )
+            self.request_schedule_appointment(entities, idempotency_key=idempotency_key, conversation=conversation)
         elif intent_data['intent'] == 'dental_question':
-            self.answer_off_hours_dental_query(user_utterance)
+            self.answer_off_hours_dental_query(user_utterance, patient_contact=contact or "patient_query_contact",
+                                               conversation=conversation)
         else:
-            response = self.llm_handler.generate_text(f"Generate a polite fallback response for: {user_utterance}")
-            self.comm_handler.send_outbound_message(
-                communication_input.get('contact') or communication_input.get('caller_id'),
-                response
-            )
+            with span("agent.generate_fallback"):
+                response = self.llm_handler.generate_text(f"Generate a polite fallback response for: {user_utterance}")
+            self.send_message(contact, response, conversation=conversation)
 
-    def request_schedule_appointment(self, patient_details: dict):
-        print(f"DentalAgent: Attempting to schedule appointment with details: {patient_details}")
+    def send_message(self, contact: Optional[str], message: str, channel: str = "SMS",
+                     conversation: Optional[Conversation] = None) -> Delivery:
+        """
+        Queue an outbound message and return its Delivery without waiting for the provider.
+
+        The patient does not need to wait for SendGrid or Twilio, so sends run off the turn's
+        critical path; the Delivery's status moves from pending to sent or failed.
+        """
+        delivery = Delivery(contact, message, channel)
+        if conversation is not None:
+            conversation.deliveries.append(delivery)
+        future = self._delivery_executor.submit(contextvars.copy_context().run, self._deliver, delivery)
+        with self._deliveries_lock:
+            self._pending_deliveries.add(future)
+        future.add_done_callback(self._delivery_done)
+        return delivery
+
+    @profiled("comm.send")
+    def _deliver(self, delivery: Delivery) -> None:
+        try:
+            sent = self.comm_handler.send_outbound_message(delivery.contact, delivery.message, delivery.channel)
+        except Exception as e:
+            sent, delivery.error = False, str(e)
+        delivery.status = "sent" if sent else "failed"
+        delivery.sent_ts = time.time()
+        with self._deliveries_lock:
+            self._delivery_counts[delivery.status] += 1
+        if not sent:
+            print(f"DentalAgent: Delivery to {delivery.contact} failed: {delivery.error or 'provider rejected it'}")
+
+    def _delivery_done(self, future: Future) -> None:
+        with self._deliveries_lock:
+            self._pending_deliveries.discard(future)
+
+    def delivery_stats(self) -> Dict[str, int]:
+        with self._deliveries_lock:
+            return dict(self._delivery_counts, pending=len(self._pending_deliveries))
+
+    def wait_for_deliveries(self, timeout: Optional[float] = None) -> bool:
+        """Wait until queued messages have been handed to the provider; returns False on timeout."""
+        with self._deliveries_lock:
+            pending = set(self._pending_deliveries)
+        return not wait(pending, timeout=timeout).not_done
+
+    def _requested_slot(self, patient_details: dict) -> Tuple[str, Optional[str]]:
+        """
+        The requested start and end, normalized to ISO 8601 with an offset (times without one are
+        practice-local); the end defaults to one appointment length after the start. A start that
+        is not a date and time (free text such as "tomorrow
+        afternoon") is returned as given, with no end.
+        """
         requested_time = patient_details.get('time', 'any available slot')
-        is_available = self.scheduler_handler.check_availability(requested_time)
+        try:
+            start = parse_practice_time(requested_time)
+            end_time = patient_details.get('end_time')
+            if end_time:
+                end = parse_practice_time(end_time)
+            else:
+                end = start + datetime.timedelta(minutes=APPOINTMENT_DURATION_MINUTES)
+        except (AttributeError, TypeError, ValueError):
+            return requested_time, None
+        return start.isoformat(), end.isoformat()
+
+    def _fresh_snapshot(self, conversation: Optional[Conversation],
+                        timeout: float = 0.0) -> Optional[AvailabilitySnapshot]:
+        """
+        The conversation's prefetched snapshot while it is fresh, else None.
+
+        A stale snapshot is replaced by a new prefetch, so a later turn in a long call has one again.
+        """
+        if conversation is None:
+            return None
+        snapshot = snapshot_from(conversation.slot_prefetch, timeout=timeout)
+        if snapshot is None or snapshot.is_fresh(self.slot_prefetcher.ttl_seconds):
+            return snapshot
+        conversation.slot_prefetch = self.slot_prefetcher.prefetch()
+        return None
+
+    @profiled("agent.check_availability")
+    def _check_availability(self, start_time: str, end_time: Optional[str],
+                            conversation: Optional[Conversation]) -> bool:
+        """
+        Answer from the conversation's fresh prefetched snapshot when it shows the slot free, else ask
+        the scheduler.
+
+        A busy slot in the snapshot is confirmed with the scheduler before the patient is declined,
+        since it may have been freed since the prefetch. A free one is re-checked when booking anyway.
+        """
+        snapshot = self._fresh_snapshot(conversation, timeout=PREFETCH_WAIT_SECONDS)
+        known = snapshot.is_available(to_epoch(start_time), to_epoch(end_time)) if snapshot and end_time else None
+        if known:
+            print(f"DentalAgent: Availability for {start_time} served from prefetched snapshot.")
+            return True
+        available = self.scheduler_handler.check_availability(start_time, end_time)
+        if known is False and available:
+            self._discard_snapshot(conversation)  # The slot was freed since the prefetch
+        return available
+
+    def _mark_booked(self, start_time: str, end_time: Optional[str], conversation: Optional[Conversation]) -> None:
+        """Add a slot that is now taken to the conversation's snapshot, which other conversations share."""
+        snapshot = self._fresh_snapshot(conversation)
+        if snapshot and end_time:
+            snapshot.mark_busy(to_epoch(start_time), to_epoch(end_time))
 
+    def _discard_snapshot(self, conversation: Optional[Conversation]) -> None:
+        """Drop a snapshot the scheduler contradicted, for new conversations too, and refetch it."""
+        if conversation is not None and conversation.slot_prefetch is not None:
+            self.slot_prefetcher.invalidate(conversation.slot_prefetch)
+            conversation.slot_prefetch = self.slot_prefetcher.prefetch()
+
+    @profiled("agent.schedule_appointment")
+    def request_schedule_appointment(self, patient_details: dict, idempotency_key: str = None,
+                                     conversation: Conversation = None):
+        print(f"DentalAgent: Attempting to schedule appointment with details: {patient_details}")
+        requested_time, end_time = self._requested_slot(patient_details)
+        if end_time is None and self.scheduler_handler.requires_exact_time:
+            # Only the mock scheduler takes free text; ask again rather than fail the turn.
+            self.send_message(patient_details.get('contact_info', 'patient_contact'),
+                              render("time_unclear", patient_details.get('locale'), time=requested_time),
+                              conversation=conversation)
+            return
+        is_available = self._check_availability(requested_time, end_time, conversation)
+        appointment_id = None
         if is_available:
-            appointment_id = self.scheduler_handler.book_appointment(patient_details, requested_time)
-            confirmation_message = f"Appointment confirmed for {patient_details.get('patient_name', 'you')} at {requested_time}. Your appointment ID is {appointment_id}."
-            self.comm_handler.send_outbound_message(
-                patient_details.get('contact_info', 'patient_contact'),
-                confirmation_message
+            # The slot may still be taken by a concurrent booking, in which case no ID comes back.
+            with span("agent.book_appointment"):
+                appointment_id = self.scheduler_handler.book_appointment(
+                    patient_details, requested_time, end_time, idempotency_key=idempotency_key
+                )
+            self._mark_booked(requested_time, end_time, conversation)
+            if not appointment_id:
+                # Reported free, but another booking got there first: the snapshot is behind.
+                self._discard_snapshot(conversation)
+
+        if appointment_id:
+            confirmation_message = render(
+                "appointment_confirmed", patient_details.get('locale'),
+                patient_name=patient_details.get('patient_name', 'you'), time=requested_time, appointment_id=appointment_id
             )
+            self.send_message(patient_details.get('contact_info', 'patient_contact'), confirmation_message,
+                              conversation=conversation)
         else:
-            alternative_message = f"Sorry, {requested_time} is not available. Would you like to try another time?"
-            self.comm_handler.send_outbound_message(
-                patient_details.get('contact_info', 'patient_contact'),
-                alternative_message
-            )
+            alternative_message = self._unavailable_message(requested_time, end_time, patient_details, conversation)
+            self.send_message(patient_details.get('contact_info', 'patient_contact'), alternative_message,
+                              conversation=conversation)
 
-    def request_change_appointment(self, appointment_id: str, new_time: str, patient_contact: str):
+    def _unavailable_message(self, requested_time: str, end_time: Optional[str], patient_details: dict,
+                             conversation: Optional[Conversation]) -> str:
+        """Decline the slot, offering the next free slots from the prefetched snapshot while it is fresh."""
+        # Waits, since a snapshot just discarded for contradicting the scheduler is being refetched.
+        snapshot = self._fresh_snapshot(conversation, timeout=PREFETCH_WAIT_SECONDS)
+        if snapshot and end_time:
+            # From the end of the declined slot, so it is never offered back.
+            offers = snapshot.free_slots(after_ts=to_epoch(end_time))
+            if offers:
+                if conversation is not None:
+                    conversation.offered_slots = offers
+                return render("appointment_unavailable_offer", patient_details.get('locale'), time=requested_time,
+                              slots=", ".join(describe_slot(start) for start, _ in offers))
+        return render("appointment_unavailable", patient_details.get('locale'), time=requested_time)
+
+    def request_change_appointment(self, appointment_id: str, new_time: str, patient_contact: str,
+                                   idempotency_key: str = None):
         print(f"DentalAgent: Attempting to change appointment {appointment_id} to {new_time}.")
-        success = self.scheduler_handler.modify_appointment(appointment_id, new_time)
-        message = f"Appointment {appointment_id} change to {new_time} {'successful' if success else 'failed'}."
-        self.comm_handler.send_outbound_message(patient_contact, message)
+        new_time, new_end_time = self._requested_slot({'time': new_time})
+        if new_end_time is None and self.scheduler_handler.requires_exact_time:
+            self.send_message(patient_contact, render("time_unclear", time=new_time))
+            return
+        success = self.scheduler_handler.modify_appointment(appointment_id, new_time, new_end_time,
+                                                            idempotency_key=idempotency_key)
+        message = render(
+            "appointment_changed" if success else "appointment_change_failed", appointment_id=appointment_id, time=new_time
+        )
+        self.send_message(patient_contact, message)
 
     def request_cancel_appointment(self, appointment_id: str, patient_contact: str):
         print(f"DentalAgent: Attempting to cancel appointment {appointment_id}.")
         success = self.scheduler_handler.cancel_appointment(appointment_id)
-        message = f"Appointment {appointment_id} cancellation {'successful' if success else 'failed'}."
-        self.comm_handler.send_outbound_message(patient_contact, message)
+        message = render("appointment_cancelled" if success else "appointment_cancel_failed", appointment_id=appointment_id)
+        self.send_message(patient_contact, message)
 
     def handle_no_show_scenario(self, appointment_id: str):
         print(f"DentalAgent: Processing no-show for appointment {appointment_id}.")
         appt_details = self.scheduler_handler.get_appointment_details(appointment_id)
-        follow_up_message = f"We missed you for your appointment {appointment_id} ({appt_details.get('time')}). Please call us to reschedule."
-        self.comm_handler.send_outbound_message(
-            appt_details.get('patient_contact', 'patient_contact_placeholder'),
-            follow_up_message
-        )
+        follow_up_message = render("no_show_follow_up", appointment_id=appointment_id, time=appt_details.time)
+        self.send_message(appt_details.patient_contact or 'patient_contact_placeholder', follow_up_message)
 
-    def answer_off_hours_dental_query(self, query_text: str, patient_contact: str = "patient_query_contact"):
+    @profiled("agent.dental_query")
+    def answer_off_hours_dental_query(self, query_text: str, patient_contact: str = "patient_query_contact",
+                                      conversation: Conversation = None):
         print(f"DentalAgent: Answering off-hours query: '{query_text}'")
         answer = self.llm_handler.query_knowledge_base(query_text)
-        self.comm_handler.send_outbound_message(patient_contact, answer) 
\ No newline at end of file
+        self.send_message(patient_contact, answer, conversation=conversation) 
\ No newline at end of file
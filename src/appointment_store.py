@@ -0,0 +1,258 @@
+"""
+Appointment Store module for the Dental Agent Prototype.
+This class provides a durable local appointment book in SQLite (WAL mode) that implements the
+SchedulerHandler interface, so several workers can share one book with indexed lookups.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from patient_directory import normalize_contact
+from records import Appointment
+from slot_reservations import to_epoch
+
+APPOINTMENT_DB_PATH = os.getenv("APPOINTMENT_DB_PATH", "appointments.db")
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS appointments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        appointment_id TEXT UNIQUE,
+        patient_name TEXT,
+        patient_contact TEXT,
+        patient_info TEXT NOT NULL,
+        start_time TEXT NOT NULL,
+        end_time TEXT NOT NULL,
+        start_ts REAL NOT NULL,
+        end_ts REAL NOT NULL,
+        status TEXT NOT NULL,
+        idempotency_key TEXT UNIQUE,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_appointments_start ON appointments (start_ts);
+    CREATE INDEX IF NOT EXISTS idx_appointments_status_start ON appointments (status, start_ts);
+    CREATE INDEX IF NOT EXISTS idx_appointments_patient_contact ON appointments (patient_contact);
+    CREATE INDEX IF NOT EXISTS idx_appointments_patient_name ON appointments (patient_name);
+"""
+
+RECORD_COLUMNS = "appointment_id, patient_name, patient_contact, start_time, end_time, status, start_ts, end_ts"
+
+# Connections are not fork-safe, so a forked worker starts with none and opens its own. One hook
+# resets every live store; a hook per instance would keep each one alive.
+_live_stores: "weakref.WeakSet[SQLiteAppointmentStore]" = weakref.WeakSet()
+
+
+def _reset_after_fork() -> None:
+    for store in list(_live_stores):
+        store._reset_connections()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class SQLiteAppointmentStore:
+    def __init__(self, db_path: str = APPOINTMENT_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+        _live_stores.add(self)
+        print(f"SQLiteAppointmentStore initialized ({db_path}).")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers proceed while another worker writes.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _reset_connections(self) -> None:
+        self._local = threading.local()
+
+    def _has_conflict(self, conn: sqlite3.Connection, start_ts: float, end_ts: float,
+                      exclude_id: Optional[str] = None) -> bool:
+        row = conn.execute(
+            "SELECT 1 FROM appointments WHERE status = 'confirmed' AND start_ts < ? AND end_ts > ? "
+            "AND appointment_id IS NOT ? LIMIT 1",
+            (end_ts, start_ts, exclude_id)
+        ).fetchone()
+        return row is not None
+
+    def check_availability(self, start_time: str, end_time: str) -> bool:
+        return not self._has_conflict(self._conn(), to_epoch(start_time), to_epoch(end_time))
+
+    def book_appointment(self, patient_info: Dict, start_time: str, end_time: str,
+                         idempotency_key: Optional[str] = None) -> Optional[str]:
+        """Atomically check the slot and book it; returns None if the slot is already taken."""
+        start_ts, end_ts = to_epoch(start_time), to_epoch(end_time)
+        conn = self._conn()
+        # BEGIN IMMEDIATE takes the write lock before the conflict check, so the check and the
+        # insert cannot interleave with another worker's booking.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if idempotency_key:
+                row = conn.execute(
+                    "SELECT appointment_id FROM appointments WHERE idempotency_key = ?", (idempotency_key,)
+                ).fetchone()
+                if row:
+                    conn.execute("COMMIT")
+                    return row[0]
+            if self._has_conflict(conn, start_ts, end_ts):
+                conn.execute("COMMIT")
+                print(f"SQLiteAppointmentStore: {start_time} - {end_time} is not available.")
+                return None
+            appointment_id = self._insert(conn, patient_info, start_time, end_time, "confirmed", idempotency_key)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"SQLiteAppointmentStore: Booked appointment {appointment_id}.")
+        return appointment_id
+
+    def _insert(self, conn: sqlite3.Connection, patient_info: Dict, start_time: str, end_time: str,
+                status: str, idempotency_key: Optional[str] = None, appointment_id: Optional[str] = None) -> str:
+        cursor = conn.execute(
+            "INSERT INTO appointments (appointment_id, patient_name, patient_contact, patient_info, start_time, "
+            "end_time, start_ts, end_ts, status, idempotency_key, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (appointment_id, _patient_name(patient_info), _patient_contact(patient_info),
+             json.dumps(patient_info), start_time, end_time, to_epoch(start_time), to_epoch(end_time),
+             status, idempotency_key, time.time())
+        )
+        if appointment_id is None:
+            # Row IDs come from AUTOINCREMENT, so they stay unique across processes and restarts.
+            appointment_id = f"APT{cursor.lastrowid:05d}"
+            conn.execute("UPDATE appointments SET appointment_id = ? WHERE id = ?", (appointment_id, cursor.lastrowid))
+        return appointment_id
+
+    def book_many(self, appointments: Iterable[Dict]) -> List[str]:
+        """
+        Insert many appointments in a single transaction, skipping availability checks.
+
+        Each item has patient_info, start_time and end_time, and optionally appointment_id and status.
+        Items whose appointment_id already exists are updated in place, which makes imports rerunnable.
+        """
+        conn = self._conn()
+        ids = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for appt in appointments:
+                appointment_id = appt.get("appointment_id")
+                if appointment_id:
+                    conn.execute("DELETE FROM appointments WHERE appointment_id = ?", (appointment_id,))
+                ids.append(self._insert(
+                    conn, appt["patient_info"], appt["start_time"], appt["end_time"],
+                    appt.get("status", "confirmed"), appointment_id=appointment_id
+                ))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"SQLiteAppointmentStore: Wrote {len(ids)} appointments.")
+        return ids
+
+    def modify_appointment(self, appointment_id: str, new_start_time: str, new_end_time: str) -> bool:
+        start_ts, end_ts = to_epoch(new_start_time), to_epoch(new_end_time)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._has_conflict(conn, start_ts, end_ts, exclude_id=appointment_id):
+                conn.execute("COMMIT")
+                print(f"SQLiteAppointmentStore: {new_start_time} is not available.")
+                return False
+            cursor = conn.execute(
+                "UPDATE appointments SET start_time = ?, end_time = ?, start_ts = ?, end_ts = ?, updated_at = ? "
+                "WHERE appointment_id = ? AND status = 'confirmed'",
+                (new_start_time, new_end_time, start_ts, end_ts, time.time(), appointment_id)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def cancel_appointment(self, appointment_id: str) -> bool:
+        return self.set_status([appointment_id], "cancelled") == 1
+
+    def set_status(self, appointment_ids: List[str], status: str) -> int:
+        """Set the status of many appointments in one write; returns the number of rows changed."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.executemany(
+                "UPDATE appointments SET status = ?, updated_at = ? WHERE appointment_id = ?",
+                [(status, time.time(), appointment_id) for appointment_id in appointment_ids]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount
+
+    def get_appointment_details(self, appointment_id: str) -> Appointment:
+        row = self._conn().execute(
+            f"SELECT {RECORD_COLUMNS}, patient_info FROM appointments WHERE appointment_id = ?", (appointment_id,)
+        ).fetchone()
+        if row is None:
+            return Appointment.not_found(appointment_id)
+        appointment = _row_to_record(row[:-1])
+        appointment.patient_info = json.loads(row[-1])
+        return appointment
+
+    def get_busy_intervals(self, start_time: str, end_time: str) -> List[Tuple[float, float]]:
+        """Return (start_ts, end_ts) of confirmed appointments overlapping [start_time, end_time)."""
+        return self._conn().execute(
+            "SELECT start_ts, end_ts FROM appointments WHERE status = 'confirmed' AND start_ts < ? AND end_ts > ? "
+            "ORDER BY start_ts",
+            (to_epoch(end_time), to_epoch(start_time))
+        ).fetchall()
+
+    def list_patient_appointments(self, contacts: List[str], start_time: str,
+                                  status: str = "confirmed") -> List[Appointment]:
+        """Return a patient's appointments (matched on any of their normalized contacts) from start_time on."""
+        contacts = [c for c in contacts if c]
+        if not contacts:
+            return []
+        placeholders = ", ".join("?" for _ in contacts)
+        rows = self._conn().execute(
+            f"SELECT {RECORD_COLUMNS} FROM appointments WHERE patient_contact IN ({placeholders}) "
+            "AND start_ts >= ? AND status = ? ORDER BY start_ts",
+            (*contacts, to_epoch(start_time), status)
+        ).fetchall()
+        return [_row_to_record(row) for row in rows]
+
+    def list_appointments(self, start_time: str, end_time: str,
+                          status: Union[str, Sequence[str], None] = None) -> List[Appointment]:
+        """Return appointments starting in [start_time, end_time) with any of the given statuses, by start time."""
+        query = f"SELECT {RECORD_COLUMNS} FROM appointments WHERE start_ts >= ? AND start_ts < ?"
+        params = [to_epoch(start_time), to_epoch(end_time)]
+        statuses = [status] if isinstance(status, str) else list(status or [])
+        if statuses:
+            query += f" AND status IN ({', '.join('?' for _ in statuses)})"
+            params.extend(statuses)
+        rows = self._conn().execute(query + " ORDER BY start_ts", params).fetchall()
+        return [_row_to_record(row) for row in rows]
+
+
+def _patient_name(patient_info: Dict) -> Optional[str]:
+    return patient_info.get("patient_name") or patient_info.get("name")
+
+
+def _patient_contact(patient_info: Dict) -> Optional[str]:
+    # Stored normalized so the patient_contact index matches caller IDs from any channel.
+    raw = patient_info.get("contact") or patient_info.get("contact_info")
+    return normalize_contact(raw) or raw
+
+
+def _row_to_record(row) -> Appointment:
+    # Timestamps come from their own columns, so nothing is re-parsed. Lists leave out
+    # patient_info to avoid decoding a JSON blob per row; get_appointment_details() includes it.
+    appointment_id, patient_name, patient_contact, start_time, end_time, status, start_ts, end_ts = row
+    return Appointment(appointment_id, patient_name or "Unknown", patient_contact, start_time, end_time, status,
+                       start_ts, end_ts)
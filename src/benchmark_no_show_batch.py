@@ -0,0 +1,74 @@
+"""
+Benchmark the no-show batch job against a local SQLite book.
+
+Books NUM_APPOINTMENTS past appointments for NUM_PATIENTS patients in a temporary database, runs
+the job once (full run) and again (incremental run from the checkpoint), and prints the timings.
+Outbound messages are counted rather than sent, so the numbers measure the job itself.
+
+python3 src/benchmark_no_show_batch.py [num_appointments] [num_patients]
+"""
+
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+tmp_dir = tempfile.mkdtemp(prefix="no_show_bench_")
+os.environ["SCHEDULER_PROVIDER"] = "sqlite"
+os.environ["APPOINTMENT_DB_PATH"] = os.path.join(tmp_dir, "appointments.db")
+os.environ["SLOT_HOLD_DB_PATH"] = os.path.join(tmp_dir, "slot_holds.db")
+
+from no_show_batch import NoShowBatchJob
+from scheduler_handler import SchedulerHandler
+
+NUM_APPOINTMENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+NUM_PATIENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+
+class CountingCommunicationHandler:
+    def __init__(self):
+        self.requests = 0
+        self.messages = 0
+
+    def send_bulk_messages(self, messages, channel="SMS"):
+        self.requests += 1
+        self.messages += len(messages)
+        return [target for target, _ in messages]
+
+
+def main():
+    scheduler = SchedulerHandler()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    day_start = now - datetime.timedelta(days=1)
+    step = datetime.timedelta(days=1) / NUM_APPOINTMENTS
+    appointments = []
+    for i in range(NUM_APPOINTMENTS):
+        start = day_start + i * step
+        patient = i % NUM_PATIENTS
+        contact = f"+1555{patient:07d}" if patient % 3 else f"patient{patient}@example.com"
+        appointments.append({
+            "patient_info": {"patient_name": f"Patient {patient}", "contact": contact},
+            "start_time": start.isoformat(),
+            "end_time": (start + datetime.timedelta(minutes=30)).isoformat(),
+        })
+    t0 = time.perf_counter()
+    scheduler.store.book_many(appointments)
+    print(f"Seeded {NUM_APPOINTMENTS} appointments in {time.perf_counter() - t0:.2f}s")
+
+    comm = CountingCommunicationHandler()
+    job = NoShowBatchJob(scheduler, comm, checkpoint_path=os.path.join(tmp_dir, "checkpoint.json"), lookback_days=2)
+
+    t0 = time.perf_counter()
+    stats = job.run()
+    elapsed = time.perf_counter() - t0
+    print(f"\nFull run: {stats} in {elapsed:.3f}s "
+          f"({stats['appointments'] / elapsed:,.0f} appointments/s, {comm.requests} bulk send calls)")
+
+    t0 = time.perf_counter()
+    stats = job.run()
+    print(f"Incremental rerun: {stats} in {time.perf_counter() - t0:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
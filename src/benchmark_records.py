@@ -0,0 +1,104 @@
+"""
+Memory benchmark for the slotted appointment and patient records.
+
+Builds NUM_APPOINTMENTS appointments (and as many patients) as the dicts the schedulers used to
+return, as full Google Calendar event resources, and as records, then prints the traced memory of
+each shape plus the time to find the latest start with ISO strings versus parsed timestamps.
+
+python3 src/benchmark_records.py [num_appointments]
+"""
+
+import datetime
+import gc
+import sys
+import time
+import tracemalloc
+
+from records import Appointment, Patient
+from slot_reservations import to_epoch
+
+NUM_APPOINTMENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+BASE = datetime.datetime(2024, 5, 1, 9, 0, tzinfo=datetime.timezone(datetime.timedelta(hours=-4)))
+
+
+def google_event(i: int) -> dict:
+    start = BASE + datetime.timedelta(minutes=30 * i)
+    return {
+        "kind": "calendar#event",
+        "etag": f'"{3400000000000000 + i}"',
+        "id": f"apt{i:026x}",
+        "status": "confirmed",
+        "htmlLink": f"https://www.google.com/calendar/event?eid=apt{i:026x}",
+        "created": "2024-04-01T12:00:00.000Z",
+        "updated": "2024-04-01T12:00:00.000Z",
+        "summary": f"Dental Appointment: Patient {i}",
+        "description": f"Patient info: {{'patient_name': 'Patient {i}', 'contact': '+1555{i:07d}'}}",
+        "creator": {"email": "practice@example.com", "self": True},
+        "organizer": {"email": "practice@example.com", "self": True},
+        "start": {"dateTime": start.isoformat(), "timeZone": "America/New_York"},
+        "end": {"dateTime": (start + datetime.timedelta(minutes=30)).isoformat(), "timeZone": "America/New_York"},
+        "iCalUID": f"apt{i:026x}@google.com",
+        "sequence": 0,
+        "extendedProperties": {"private": {"patient_contact": f"+1555{i:07d}"}},
+        "reminders": {"useDefault": True},
+        "eventType": "default",
+    }
+
+
+def details_dict(event: dict) -> dict:
+    # The shape list_appointments() returned before records.
+    return {
+        "id": event["id"],
+        "patient_name": event["summary"].split(": ", 1)[1],
+        "patient_contact": event["extendedProperties"]["private"]["patient_contact"],
+        "time": event["start"]["dateTime"],
+        "end_time": event["end"]["dateTime"],
+        "status": event["status"],
+    }
+
+
+def measure(label: str, build, baseline: float = None):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    ratio = f"{used / baseline:>6.2f}x" if baseline else "      -"
+    print(f"{label:<40} {used / 2**20:>9.1f} MiB {used / len(items):>8.0f} B/item {ratio}")
+    return items, used
+
+
+def main():
+    print(f"{NUM_APPOINTMENTS:,} appointments and patients\n")
+    print(f"{'shape':<40} {'memory':>13} {'per item':>15} {'ratio':>7}")
+    events, events_used = measure("Google event resources", lambda: [google_event(i) for i in range(NUM_APPOINTMENTS)])
+    dicts, dicts_used = measure("appointment details dicts", lambda: [details_dict(e) for e in events])
+    # From events still held by the caller, so only the record itself is new memory.
+    records, _ = measure("Appointment records (vs details dicts)",
+                         lambda: [Appointment.from_event(e) for e in events], dicts_used)
+    del records
+    # Nothing else referencing the event: what a long-lived cache or local book actually holds.
+    del events
+    measure("Appointment records alone (vs events)",
+            lambda: [Appointment.from_event(google_event(i)) for i in range(NUM_APPOINTMENTS)], events_used)
+    patient_info = [{"name": f"Patient {i}", "phone": f"+1555{i:07d}", "email": f"patient{i}@example.com"}
+                    for i in range(NUM_APPOINTMENTS)]
+    _, patient_dicts_used = measure("patient dicts", lambda: [dict(info, patient_id=f"PAT{i:05d}")
+                                                               for i, info in enumerate(patient_info)])
+    measure("Patient records (vs patient dicts)",
+            lambda: [Patient.from_info(f"PAT{i:05d}", info) for i, info in enumerate(patient_info)], patient_dicts_used)
+
+    records = [Appointment.from_event(google_event(i)) for i in range(NUM_APPOINTMENTS)]
+    start = time.perf_counter()
+    max(dicts, key=lambda d: to_epoch(d["time"]))
+    parse_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    max(records, key=lambda r: r.start_ts)
+    ts_seconds = time.perf_counter() - start
+    print(f"\nLatest start: {parse_seconds * 1000:.1f} ms parsing ISO strings, {ts_seconds * 1000:.1f} ms with start_ts")
+
+
+if __name__ == "__main__":
+    main()
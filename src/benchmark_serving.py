@@ -0,0 +1,95 @@
+"""
+Throughput benchmark for the multi-process serving mode.
+
+Starts gunicorn with 1..MAX_WORKERS workers, sends NUM_REQUESTS POST /recording webhooks from
+CONCURRENCY client threads to each configuration, and prints requests per second.
+
+Each recording runs a full agent turn (patient lookup, intent, reply) against a temporary SQLite
+appointment book, with the mock LLM and transcript so no external API is called.
+
+cd src && python3 benchmark_serving.py [max_workers] [num_requests] [concurrency]
+"""
+
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+MAX_WORKERS = int(sys.argv[1]) if len(sys.argv) > 1 else multiprocessing.cpu_count()
+NUM_REQUESTS = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+CONCURRENCY = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(num_workers: int, port: int, data_dir: str) -> subprocess.Popen:
+    env = dict(
+        os.environ, WEB_CONCURRENCY=str(num_workers), BIND=f"127.0.0.1:{port}",
+        VOICE_USE_AGENT="1", LLM_PROVIDER="mock", ELEVENLABS_API_KEY="", SCHEDULER_PROVIDER="sqlite",
+        APPOINTMENT_DB_PATH=os.path.join(data_dir, "appointments.db"),
+        SLOT_HOLD_DB_PATH=os.path.join(data_dir, "slot_holds.db"),
+        TTS_CACHE_DIR=os.path.join(data_dir, "tts_cache"),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn_conf.py", "voice_demo:app"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/healthz", timeout=1).ok:
+                return server
+        except requests.RequestException:  # Not listening yet, or workers still booting
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("gunicorn did not become ready")
+
+
+def run_load(port: int) -> float:
+    # A new connection per request, like Twilio's webhook deliveries.
+    def call(i):
+        response = requests.post(f"http://127.0.0.1:{port}/recording", data={
+            "From": f"+1555{i % 1000:07d}",
+            "CallSid": f"CA{i // 4:032d}",  # A few turns per call
+            "RecordingSid": f"RE{port}{i:030d}",
+            "RecordingUrl": "https://api.twilio.com/recording",
+        })
+        response.raise_for_status()
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        list(pool.map(call, range(CONCURRENCY)))  # warm up
+        start = time.perf_counter()
+        list(pool.map(call, range(NUM_REQUESTS)))
+        return NUM_REQUESTS / (time.perf_counter() - start)
+
+
+def main():
+    print(f"{'workers':>8} {'req/s':>10} {'speedup':>8}")
+    baseline = None
+    for num_workers in range(1, MAX_WORKERS + 1):
+        port = free_port()
+        with tempfile.TemporaryDirectory() as data_dir:
+            server = start_server(num_workers, port, data_dir)
+            try:
+                throughput = run_load(port)
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
+        baseline = baseline or throughput
+        print(f"{num_workers:>8} {throughput:>10,.0f} {throughput / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
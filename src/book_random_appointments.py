@@ -39,8 +39,8 @@ def main():
             print(f"Booked: {patient_info['patient_name']} at {start_time} (ID: {appt_id})")
             if hasattr(scheduler, 'google_handler'):
                 details = scheduler.get_appointment_details(appt_id)
-                if details and 'htmlLink' in details:
-                    print(f"  View: {details['htmlLink']}")
+                if details and details.html_link:
+                    print(f"  View: {details.html_link}")
             booked += 1
         else:
             print(f"Slot not available: {start_time}")
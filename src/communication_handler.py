@@ -4,8 +4,12 @@ This class provides a mocked interface for all communication channels (SMS, voic
 """
 
 import os
+from typing import List, Tuple
 from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
+from sendgrid.helpers.mail import Mail, Personalization, To, Substitution
+
+# SendGrid accepts at most 1000 personalizations (recipients with their own body) per request.
+SENDGRID_MAX_PERSONALIZATIONS = 1000
 
 class CommunicationHandler:
     def __init__(self):
@@ -48,6 +52,38 @@ class CommunicationHandler:
             print(f"Error sending email via SendGrid: {e}")
             return False
 
+    def send_bulk_messages(self, messages: List[Tuple[str, str]], channel: str = "SMS") -> List[str]:
+        """
+        Send many (target_contact, message_body) pairs; returns the targets that were accepted.
+
+        Emails go out through SendGrid as one request per 1000 recipients, each recipient getting
+        their own body through a substitution. Other channels are sent one by one.
+        """
+        if channel.upper() != "EMAIL" or not self.sendgrid_api_key or not self.email_from:
+            return [target for target, body in messages if self.send_outbound_message(target, body, channel)]
+        delivered = []
+        sg = SendGridAPIClient(self.sendgrid_api_key)
+        for i in range(0, len(messages), SENDGRID_MAX_PERSONALIZATIONS):
+            chunk = messages[i:i + SENDGRID_MAX_PERSONALIZATIONS]
+            message = Mail(
+                from_email=self.email_from,
+                subject="Dental Agent Follow-up",
+                plain_text_content="-message_body-"
+            )
+            for target, body in chunk:
+                personalization = Personalization()
+                personalization.add_to(To(target))
+                personalization.add_substitution(Substitution("-message_body-", body))
+                message.add_personalization(personalization)
+            try:
+                response = sg.send(message)
+                print(f"SendGrid bulk email sent to {len(chunk)} recipients. Status: {response.status_code}")
+                if response.status_code < 300:
+                    delivered.extend(target for target, _ in chunk)
+            except Exception as e:
+                print(f"Error sending bulk email via SendGrid: {e}")
+        return delivered
+
     def initiate_outbound_call_simulation(self, target_contact: str, call_script_identifier: str) -> str:
         print(f"CommunicationHandler (Mock): Simulating outbound call to {target_contact} using script '{call_script_identifier}'.")
         return "call_sim_id_789"
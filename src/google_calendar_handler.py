@@ -18,25 +18,39 @@ Dependencies:
 pip install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib
 """
 
+import base64
 import datetime
+import hashlib
 import os.path
+import threading
 from typing import Dict, Optional
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 
+from patient_directory import normalize_contact
+from profiler import profiled, span
+from single_flight import SingleFlight, make_key
+
 SCOPES = ['https://www.googleapis.com/auth/calendar']
+MAX_CONDITIONAL_UPDATE_ATTEMPTS = 3
+
+_single_flight = SingleFlight("calendar")
 
 class GoogleCalendarHandler:
     def __init__(self, calendar_id: str = 'primary'):
         self.creds = None
         self.calendar_id = calendar_id
-        self.service = self._authenticate()
+        self._local = threading.local()
+        self._authenticate()
         print(f"GoogleCalendarHandler initialized for calendar: {calendar_id}")
 
     def _authenticate(self):
-        """Authenticate and return the Google Calendar service object."""
+        """Load or obtain the OAuth credentials shared by every thread's service object."""
         if os.path.exists('../token.json'):
             self.creds = Credentials.from_authorized_user_file('../token.json', SCOPES)
         # If there are no (valid) credentials, let the user log in.
@@ -49,45 +63,147 @@ class GoogleCalendarHandler:
             # Save the credentials for the next run
             with open('../token.json', 'w') as token:
                 token.write(self.creds.to_json())
-        return build('calendar', 'v3', credentials=self.creds)
-
-    def check_availability(self, start_time: str, end_time: str) -> bool:
-        """Check if the time slot is available (no conflicting events)."""
-        events_result = self.service.events().list(
-            calendarId=self.calendar_id,
-            timeMin=start_time,
-            timeMax=end_time,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        events = events_result.get('items', [])
+
+    @property
+    def service(self):
+        """
+        This thread's Google Calendar service object.
+
+        httplib2.Http is not thread-safe, and prefetch, patient lookup and request threads all call
+        the API at once, so each thread gets its own authorized Http (and service built on it).
+        """
+        service = getattr(self._local, "service", None)
+        if service is None:
+            http = AuthorizedHttp(self.creds, http=httplib2.Http())
+            service = self._local.service = build('calendar', 'v3', http=http)
+        return service
+
+    @profiled("calendar.check_availability")
+    def check_availability(self, start_time: str, end_time: str, exclude_event_id: Optional[str] = None,
+                           coalesce: bool = True) -> bool:
+        """
+        Check if the time slot is available (no conflicting events other than exclude_event_id).
+
+        Pass coalesce=False for the authoritative re-check made while holding the slot: a shared
+        result may have been read before the hold was taken.
+        """
+        def list_events():
+            return self.service.events().list(
+                calendarId=self.calendar_id,
+                timeMin=start_time,
+                timeMax=end_time,
+                singleEvents=True,
+                orderBy='startTime'
+            ).execute()
+
+        if coalesce:
+            # Workers checking the same slot at the same moment share one events().list call.
+            events_result = _single_flight.do(make_key(self.calendar_id, start_time, end_time), list_events)
+        else:
+            events_result = list_events()
+        events = [e for e in events_result.get('items', []) if e.get('id') != exclude_event_id]
         return len(events) == 0
 
-    def book_appointment(self, patient_info: Dict, start_time: str, end_time: str) -> str:
-        """Book an appointment as a calendar event."""
+    @profiled("calendar.get_busy_intervals")
+    def get_busy_intervals(self, time_min: str, time_max: str):
+        """Return the calendar's busy periods in [time_min, time_max) as (start, end) ISO strings."""
+        result = self.service.freebusy().query(body={
+            'timeMin': time_min,
+            'timeMax': time_max,
+            'items': [{'id': self.calendar_id}],
+        }).execute()
+        busy = result.get('calendars', {}).get(self.calendar_id, {}).get('busy', [])
+        return [(period['start'], period['end']) for period in busy]
+
+    def event_id_for_key(self, idempotency_key: str) -> str:
+        """
+        Derive a deterministic event ID from an idempotency key.
+
+        Calendar event IDs must use base32hex characters (a-v, 0-9), so a retried insert with
+        the same key reuses the same ID and is rejected by Google as a duplicate (409).
+        """
+        digest = hashlib.sha256(f"{self.calendar_id}:{idempotency_key}".encode("utf-8")).digest()
+        return base64.b32hexencode(digest).decode("ascii").rstrip("=").lower()
+
+    @profiled("calendar.find_booking")
+    def find_booking(self, idempotency_key: str) -> Optional[str]:
+        """Return the ID of a live event already booked with this idempotency key, if any."""
+        event_id = self.event_id_for_key(idempotency_key)
+        try:
+            event = self.service.events().get(calendarId=self.calendar_id, eventId=event_id).execute()
+        except HttpError as e:
+            if e.resp.status in (404, 410):
+                return None
+            raise
+        return None if event.get('status') == 'cancelled' else event_id
+
+    @profiled("calendar.book_appointment")
+    def book_appointment(self, patient_info: Dict, start_time: str, end_time: str,
+                         idempotency_key: Optional[str] = None) -> Optional[str]:
+        """Book an appointment as a calendar event; with an idempotency key, retries never insert twice."""
         event = {
             'summary': f"Dental Appointment: {patient_info.get('patient_name', 'Unknown')}",
             'description': f"Patient info: {patient_info}",
             'start': {'dateTime': start_time, 'timeZone': 'America/New_York'},
             'end': {'dateTime': end_time, 'timeZone': 'America/New_York'},
         }
-        created_event = self.service.events().insert(calendarId=self.calendar_id, body=event).execute()
+        patient_contact = normalize_contact(patient_info.get('contact') or patient_info.get('contact_info'))
+        if patient_contact:
+            # Private extended properties are filterable server-side, unlike the description text.
+            event['extendedProperties'] = {'private': {'patient_contact': patient_contact}}
+        if idempotency_key:
+            event['id'] = self.event_id_for_key(idempotency_key)
+        try:
+            created_event = self.service.events().insert(calendarId=self.calendar_id, body=event).execute()
+        except HttpError as e:
+            if e.resp.status == 409 and idempotency_key:
+                # An earlier attempt with the same key already created the event.
+                existing_id = self.find_booking(idempotency_key)
+                print(f"Idempotent booking replay for key {idempotency_key}: {existing_id}")
+                return existing_id
+            raise
         print(f"Booked appointment: {created_event.get('id')}")
         return created_event.get('id')
 
-    def modify_appointment(self, appointment_id: str, new_start_time: str, new_end_time: str) -> bool:
-        """Modify an existing appointment's time."""
-        try:
-            event = self.service.events().get(calendarId=self.calendar_id, eventId=appointment_id).execute()
-            event['start']['dateTime'] = new_start_time
-            event['end']['dateTime'] = new_end_time
-            updated_event = self.service.events().update(calendarId=self.calendar_id, eventId=appointment_id, body=event).execute()
-            print(f"Modified appointment: {appointment_id}")
-            return True
-        except Exception as e:
-            print(f"Error modifying appointment: {e}")
-            return False
+    @profiled("calendar.modify_appointment")
+    def modify_appointment(self, appointment_id: str, new_start_time: str, new_end_time: str,
+                           etag: Optional[str] = None) -> bool:
+        """
+        Modify an existing appointment's time with an etag-conditional update.
+
+        If etag is given, the update only applies if the event has not changed since the caller
+        read it. Otherwise the read-modify-write is retried when another writer wins the race.
+        """
+        attempts = 1 if etag else MAX_CONDITIONAL_UPDATE_ATTEMPTS
+        for _ in range(attempts):
+            try:
+                event = self.service.events().get(calendarId=self.calendar_id, eventId=appointment_id).execute()
+                if (event['start'].get('dateTime') == new_start_time
+                        and event['end'].get('dateTime') == new_end_time):
+                    # Already at the requested time, e.g. a retried request that succeeded.
+                    return True
+                if etag and event.get('etag') != etag:
+                    print(f"Appointment {appointment_id} changed since it was read; not modifying.")
+                    return False
+                event['start']['dateTime'] = new_start_time
+                event['end']['dateTime'] = new_end_time
+                request = self.service.events().update(calendarId=self.calendar_id, eventId=appointment_id, body=event)
+                request.headers['If-Match'] = event['etag']
+                request.execute()
+                print(f"Modified appointment: {appointment_id}")
+                return True
+            except HttpError as e:
+                if e.resp.status == 412:
+                    print(f"Concurrent update to appointment {appointment_id} detected.")
+                    continue
+                print(f"Error modifying appointment: {e}")
+                return False
+            except Exception as e:
+                print(f"Error modifying appointment: {e}")
+                return False
+        return False
 
+    @profiled("calendar.cancel_appointment")
     def cancel_appointment(self, appointment_id: str) -> bool:
         """Cancel (delete) an appointment."""
         try:
@@ -98,6 +214,64 @@ class GoogleCalendarHandler:
             print(f"Error cancelling appointment: {e}")
             return False
 
+    def list_appointments(self, time_min: str, time_max: str):
+        """Yield every event in [time_min, time_max), following pagination."""
+        page_token = None
+        while True:
+            # Spans close before yielding, since the caller may resume the generator elsewhere.
+            with span("calendar.list_appointments"):
+                events_result = self.service.events().list(
+                    calendarId=self.calendar_id,
+                    timeMin=time_min,
+                    timeMax=time_max,
+                    singleEvents=True,
+                    orderBy='startTime',
+                    maxResults=2500,
+                    pageToken=page_token
+                ).execute()
+            yield from events_result.get('items', [])
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                break
+
+    @profiled("calendar.set_status")
+    def set_status(self, appointment_ids, status: str) -> int:
+        """Record a status on many events with batched patch requests; returns how many succeeded."""
+        updated = 0
+
+        def on_response(request_id, response, exception):
+            nonlocal updated
+            if exception is not None:
+                print(f"Error setting status on appointment {request_id}: {exception}")
+            else:
+                updated += 1
+
+        appointment_ids = list(appointment_ids)
+        # The Calendar batch endpoint accepts at most 50 calls per request.
+        for i in range(0, len(appointment_ids), 50):
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for appointment_id in appointment_ids[i:i + 50]:
+                batch.add(self.service.events().patch(
+                    calendarId=self.calendar_id,
+                    eventId=appointment_id,
+                    body={'extendedProperties': {'private': {'status': status}}}
+                ), request_id=appointment_id)
+            batch.execute()
+        return updated
+
+    def list_patient_appointments(self, contact: str, time_min: str):
+        """Yield upcoming events booked for a patient's normalized contact."""
+        with span("calendar.list_patient_appointments"):
+            events_result = self.service.events().list(
+                calendarId=self.calendar_id,
+                timeMin=time_min,
+                privateExtendedProperty=f"patient_contact={contact}",
+                singleEvents=True,
+                orderBy='startTime'
+            ).execute()
+        yield from events_result.get('items', [])
+
+    @profiled("calendar.get_appointment_details")
     def get_appointment_details(self, appointment_id: str) -> Optional[Dict]:
         """Get details for a specific appointment."""
         try:
@@ -105,4 +279,4 @@ class GoogleCalendarHandler:
             return event
         except Exception as e:
             print(f"Error fetching appointment details: {e}")
-            return None 
\ No newline at end of file
+            return None
@@ -0,0 +1,40 @@
+"""
+Gunicorn configuration for serving the voice app with multiple worker processes.
+
+    cd src && gunicorn -c gunicorn_conf.py voice_demo:app
+
+The app is imported once in the master (preload_app), read-only state is warmed there and frozen
+out of the garbage collector, and workers are forked from it so they share those pages
+copy-on-write. Each worker then builds its own DentalAgent, since API clients and database
+connections cannot be shared across fork(). SIGTERM drains in-flight calls for up to
+graceful_timeout seconds before workers exit.
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Workers split the LLM rate limits between them, so they need to know how many there are.
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "gthread"
+threads = int(os.getenv("WORKER_THREADS", "4"))
+preload_app = True
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+accesslog = os.getenv("ACCESS_LOG")
+
+
+def when_ready(server):
+    import voice_demo
+    voice_demo.warm_shared_state()
+    # Objects allocated so far are moved out of GC tracking, so collections in the workers do not
+    # write to (and un-share) the pages holding them.
+    gc.freeze()
+    server.log.info("Shared state warmed; forking %s workers.", workers)
+
+
+def post_fork(server, worker):
+    import voice_demo
+    voice_demo.init_agent()
@@ -0,0 +1,69 @@
+"""
+Import appointments from Google Calendar into the local SQLite appointment store.
+
+Events keep their Google event IDs as appointment IDs, so rerunning the import over the same
+range updates rows in place instead of duplicating them.
+"""
+
+import argparse
+import ast
+import datetime
+
+import pytz
+
+from appointment_store import SQLiteAppointmentStore
+from google_calendar_handler import GoogleCalendarHandler
+
+BATCH_SIZE = 500
+SUMMARY_PREFIX = "Dental Appointment: "
+
+
+def event_to_appointment(event: dict) -> dict:
+    """Map a Google Calendar event onto a book_many() item."""
+    description = event.get('description') or ""
+    patient_info = {}
+    if description.startswith("Patient info: "):
+        # book_appointment() stores patient_info as a stringified dict in the description.
+        try:
+            patient_info = ast.literal_eval(description[len("Patient info: "):])
+        except (ValueError, SyntaxError):
+            patient_info = {}
+    summary = event.get('summary', "")
+    if 'patient_name' not in patient_info and summary.startswith(SUMMARY_PREFIX):
+        patient_info['patient_name'] = summary[len(SUMMARY_PREFIX):]
+    return {
+        "appointment_id": event['id'],
+        "patient_info": patient_info,
+        "start_time": event['start'].get('dateTime') or event['start'].get('date') + "T00:00:00+00:00",
+        "end_time": event['end'].get('dateTime') or event['end'].get('date') + "T00:00:00+00:00",
+        "status": "cancelled" if event.get('status') == 'cancelled' else "confirmed",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days-back", type=int, default=30)
+    parser.add_argument("--days-ahead", type=int, default=90)
+    parser.add_argument("--calendar-id", default="primary")
+    args = parser.parse_args()
+
+    tz = pytz.timezone('America/New_York')
+    now = datetime.datetime.now(tz)
+    time_min = (now - datetime.timedelta(days=args.days_back)).isoformat()
+    time_max = (now + datetime.timedelta(days=args.days_ahead)).isoformat()
+
+    calendar = GoogleCalendarHandler(calendar_id=args.calendar_id)
+    store = SQLiteAppointmentStore()
+    batch, imported = [], 0
+    for event in calendar.list_appointments(time_min, time_max):
+        batch.append(event_to_appointment(event))
+        if len(batch) >= BATCH_SIZE:
+            imported += len(store.book_many(batch))
+            batch = []
+    if batch:
+        imported += len(store.book_many(batch))
+    print(f"\nImported {imported} appointments from {time_min} to {time_max}.")
+
+
+if __name__ == "__main__":
+    main()
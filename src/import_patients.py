@@ -0,0 +1,29 @@
+"""
+Load patients from a CSV file (columns: name, phone, email) into the patient directory.
+Rows matching an existing patient's phone or email update that patient.
+"""
+
+import csv
+import sys
+
+from patient_directory import get_patient_directory
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python3 src/import_patients.py patients.csv")
+        sys.exit(1)
+    directory = get_patient_directory()
+    if directory.db_path == ":memory:":
+        print("Set PATIENT_DB_PATH (or SCHEDULER_PROVIDER=sqlite) to import into a database file.")
+        sys.exit(1)
+    count = 0
+    with open(sys.argv[1], newline="") as f:
+        for row in csv.DictReader(f):
+            directory.upsert_patient(row["name"], phone=row.get("phone"), email=row.get("email"))
+            count += 1
+    print(f"\nImported {count} patients.")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,5 +6,7 @@ This package provides implementations for different LLM services.
 from .base_handler import BaseLLMHandler
 from .gpt_handler import GPTHandler
 from .gemini_handler import GeminiHandler
+from .rate_limiter import RateLimitExceeded, get_rate_limiter, get_rate_limit_metrics
 
-__all__ = ['BaseLLMHandler', 'GPTHandler', 'GeminiHandler'] 
\ No newline at end of file
+__all__ = ['BaseLLMHandler', 'GPTHandler', 'GeminiHandler',
+           'RateLimitExceeded', 'get_rate_limiter', 'get_rate_limit_metrics'] 
\ No newline at end of file
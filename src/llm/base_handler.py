@@ -4,9 +4,19 @@ This module provides the abstract base class for all LLM implementations.
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Optional, Any
+from typing import Any, Callable, Dict, Optional
+
+from profiler import span
+from single_flight import SingleFlight, make_key
+from .rate_limiter import get_rate_limiter
+
+# Shared by every handler in the process; keys include provider, model and parameters.
+_single_flight = SingleFlight("llm")
 
 class BaseLLMHandler(ABC):
+    # Provider name used to look up rate limits; set by each implementation.
+    provider = "default"
+
     def __init__(self, api_key: str, model_name: str):
         """
         Initialize the LLM handler.
@@ -17,6 +27,7 @@ class BaseLLMHandler(ABC):
         """
         self.api_key = api_key
         self.model_name = model_name
+        self.rate_limiter = get_rate_limiter(self.provider, model_name)
         self._validate_api_key()
         print(f"{self.__class__.__name__} initialized with model: {model_name}")
 
@@ -78,4 +89,29 @@ class BaseLLMHandler(ABC):
         """
         if context:
             return f"Context: {context}\n\nPrompt: {prompt}"
-        return prompt 
\ No newline at end of file
+        return prompt
+
+    def _call_with_limits(self, fn: Callable[[], Any], prompt: str, max_tokens: int, **params: Any) -> Any:
+        """
+        Make a provider call through this handler's rate limiter.
+
+        Identical concurrent calls (same provider, model, normalized prompt, max_tokens and params)
+        are coalesced onto one upstream request. The token cost is estimated up front (about four
+        characters per prompt token plus the output budget) and corrected from the reported usage.
+        """
+        key = make_key(self.provider, self.model_name, prompt, max_tokens=max_tokens, **params)
+        with span(f"llm.{self.provider}"):
+            return _single_flight.do(key, lambda: self.rate_limiter.call(
+                fn,
+                estimated_tokens=len(prompt) // 4 + max_tokens,
+                is_rate_limit_error=self._is_rate_limit_error,
+                usage_tokens=self._usage_tokens,
+            ))
+
+    def _is_rate_limit_error(self, error: Exception) -> bool:
+        """Whether a provider error is a rate limit (HTTP 429) that should be retried."""
+        return getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429
+
+    def _usage_tokens(self, response: Any) -> Optional[int]:
+        """Total tokens a provider response reports using, if available."""
+        return None
@@ -8,6 +8,8 @@ from typing import Dict, Optional, Any
 from .base_handler import BaseLLMHandler
 
 class GeminiHandler(BaseLLMHandler):
+    provider = "gemini"
+
     def __init__(self, api_key: str, model_name: str = "gemini-pro"):
         """
         Initialize the Gemini handler.
@@ -28,6 +30,10 @@ class GeminiHandler(BaseLLMHandler):
         except Exception as e:
             raise ValueError(f"Invalid Google API key: {str(e)}")
 
+    def _usage_tokens(self, response) -> Optional[int]:
+        usage = getattr(response, "usage_metadata", None)
+        return usage.total_token_count if usage else None
+
     def generate_text(self, prompt: str, context: Optional[str] = None) -> str:
         """
         Generate text using Gemini.
@@ -42,13 +48,13 @@ class GeminiHandler(BaseLLMHandler):
         formatted_prompt = self._format_prompt(prompt, context)
         
         try:
-            response = self.model.generate_content(
+            response = self._call_with_limits(lambda: self.model.generate_content(
                 formatted_prompt,
                 generation_config=genai.types.GenerationConfig(
                     temperature=0.7,
                     max_output_tokens=500,
                 )
-            )
+            ), formatted_prompt, 500, temperature=0.7)
             return response.text
         except Exception as e:
             print(f"Error generating text with Gemini: {str(e)}")
@@ -71,13 +77,14 @@ class GeminiHandler(BaseLLMHandler):
         Return ONLY the JSON object, no other text."""
 
         try:
-            response = self.model.generate_content(
-                f"{system_prompt}\n\nUser input: {user_input}",
+            prompt = f"{system_prompt}\n\nUser input: {user_input}"
+            response = self._call_with_limits(lambda: self.model.generate_content(
+                prompt,
                 generation_config=genai.types.GenerationConfig(
                     temperature=0.3,
                     max_output_tokens=150,
                 )
-            )
+            ), prompt, 150, temperature=0.3)
             # Parse the response as JSON
             import json
             return json.loads(response.text)
@@ -101,13 +108,14 @@ class GeminiHandler(BaseLLMHandler):
         Keep responses concise and clear."""
 
         try:
-            response = self.model.generate_content(
-                f"{system_prompt}\n\nQuestion: {question}",
+            prompt = f"{system_prompt}\n\nQuestion: {question}"
+            response = self._call_with_limits(lambda: self.model.generate_content(
+                prompt,
                 generation_config=genai.types.GenerationConfig(
                     temperature=0.5,
                     max_output_tokens=300,
                 )
-            )
+            ), prompt, 300, temperature=0.5)
             return response.text
         except Exception as e:
             print(f"Error querying knowledge base with Gemini: {str(e)}")
@@ -8,6 +8,8 @@ from typing import Dict, Optional, Any
 from .base_handler import BaseLLMHandler
 
 class GPTHandler(BaseLLMHandler):
+    provider = "openai"
+
     def __init__(self, api_key: str, model_name: str = "gpt-4"):
         """
         Initialize the GPT handler.
@@ -18,6 +20,8 @@ class GPTHandler(BaseLLMHandler):
         """
         super().__init__(api_key, model_name)
         openai.api_key = api_key
+        # Retries are handled by our rate limiter, which knows about every in-flight call.
+        openai.max_retries = 0
 
     def _validate_api_key(self) -> None:
         """Validate the OpenAI API key."""
@@ -27,6 +31,13 @@ class GPTHandler(BaseLLMHandler):
         except Exception as e:
             raise ValueError(f"Invalid OpenAI API key: {str(e)}")
 
+    def _is_rate_limit_error(self, error: Exception) -> bool:
+        return isinstance(error, openai.RateLimitError)
+
+    def _usage_tokens(self, response) -> Optional[int]:
+        usage = getattr(response, "usage", None)
+        return usage.total_tokens if usage else None
+
     def generate_text(self, prompt: str, context: Optional[str] = None) -> str:
         """
         Generate text using GPT.
@@ -41,7 +52,7 @@ class GPTHandler(BaseLLMHandler):
         formatted_prompt = self._format_prompt(prompt, context)
         
         try:
-            response = openai.chat.completions.create(
+            response = self._call_with_limits(lambda: openai.chat.completions.create(
                 model=self.model_name,
                 messages=[
                     {"role": "system", "content": "You are a helpful dental assistant."},
@@ -49,7 +60,7 @@ class GPTHandler(BaseLLMHandler):
                 ],
                 temperature=0.7,
                 max_tokens=500
-            )
+            ), formatted_prompt, 500, temperature=0.7)
             return response.choices[0].message.content
         except Exception as e:
             print(f"Error generating text with GPT: {str(e)}")
@@ -72,7 +83,7 @@ class GPTHandler(BaseLLMHandler):
         Return ONLY the JSON object, no other text."""
 
         try:
-            response = openai.chat.completions.create(
+            response = self._call_with_limits(lambda: openai.chat.completions.create(
                 model=self.model_name,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -80,7 +91,7 @@ class GPTHandler(BaseLLMHandler):
                 ],
                 temperature=0.3,
                 max_tokens=150
-            )
+            ), system_prompt + user_input, 150, temperature=0.3)
             # Parse the response as JSON
             import json
             return json.loads(response.choices[0].message.content)
@@ -104,7 +115,7 @@ class GPTHandler(BaseLLMHandler):
         Keep responses concise and clear."""
 
         try:
-            response = openai.chat.completions.create(
+            response = self._call_with_limits(lambda: openai.chat.completions.create(
                 model=self.model_name,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -112,7 +123,7 @@ class GPTHandler(BaseLLMHandler):
                 ],
                 temperature=0.5,
                 max_tokens=300
-            )
+            ), system_prompt + question, 300, temperature=0.5)
             return response.choices[0].message.content
         except Exception as e:
             print(f"Error querying knowledge base with GPT: {str(e)}")
@@ -0,0 +1,259 @@
+"""
+Rate Limiter module for the Dental Agent Prototype.
+This module provides client-side limits for outbound LLM calls: token buckets for request and
+token budgets (per provider and per model), AIMD adaptive concurrency, and retries with jittered
+exponential backoff that honour the provider's Retry-After.
+"""
+
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Budgets per provider, and optionally per "provider:model", as requests and tokens per minute.
+# Override with LLM_RATE_LIMITS, e.g. '{"openai": {"rpm": 3500}, "openai:gpt-4": {"tpm": 40000}}'.
+# These are account-wide quotas. Each process has its own buckets, so under a pre-fork server every
+# worker gets an equal share (LLM_RATE_LIMIT_PROCESSES, default WEB_CONCURRENCY or 1).
+DEFAULT_RATE_LIMITS: Dict[str, Dict[str, float]] = {
+    "openai": {"rpm": 500, "tpm": 30000, "max_concurrency": 16},
+    "gemini": {"rpm": 60, "tpm": 32000, "max_concurrency": 8},
+}
+LLM_RATE_LIMIT_PROCESSES = int(os.getenv("LLM_RATE_LIMIT_PROCESSES", os.getenv("WEB_CONCURRENCY", "1")))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "30"))
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call is still rate limited after all retries."""
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount from the bucket now, returning how long the caller must wait before using it."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+    def adjust(self, delta: float) -> None:
+        """Correct an earlier reservation once the real cost is known (positive delta costs more)."""
+        with self._lock:
+            self._refill()
+            self._tokens -= delta
+
+
+class AIMDConcurrencyLimiter:
+    """
+    Concurrency limit that grows by one per window of successes and halves on a rate-limit response.
+
+    Other failures leave the limit unchanged: they say nothing about how much load the provider takes.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, initial_limit: Optional[int] = None,
+                 decrease_factor: float = 0.5):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.decrease_factor = decrease_factor
+        self.limit = float(initial_limit or max(min_limit, max_limit // 2))
+        self.in_flight = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self.in_flight >= int(self.limit):
+                    self._cond.wait()
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False, succeeded: bool = True) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            elif succeeded:
+                # Additive increase of one slot per `limit` successful calls.
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    def __init__(self, name: str, request_buckets: List[TokenBucket], token_buckets: List[TokenBucket],
+                 concurrency: AIMDConcurrencyLimiter, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base: float = LLM_BACKOFF_BASE_SECONDS, backoff_max: float = LLM_BACKOFF_MAX_SECONDS):
+        self.name = name
+        self.request_buckets = request_buckets
+        self.token_buckets = token_buckets
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "throttled": 0, "retries": 0, "failed": 0, "wait_seconds": 0.0}
+
+    def _count(self, key: str, amount: float = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _reserve(self, estimated_tokens: int) -> None:
+        wait = max([bucket.reserve(1) for bucket in self.request_buckets]
+                   + [bucket.reserve(estimated_tokens) for bucket in self.token_buckets] + [0.0])
+        if wait > 0:
+            self._count("wait_seconds", wait)
+            time.sleep(wait)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        # Full jitter spreads retries from many workers; never retry before the provider asks us to.
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: int,
+             is_rate_limit_error: Callable[[Exception], bool],
+             usage_tokens: Callable[[Any], Optional[int]] = lambda response: None) -> Any:
+        """
+        Run fn within the budgets, retrying rate-limit errors.
+
+        Errors that are not rate limits propagate immediately; a rate limit that persists past
+        max_retries raises RateLimitExceeded.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._reserve(estimated_tokens)
+            self.concurrency.acquire()
+            throttled = succeeded = False
+            try:
+                self._count("calls")
+                response = fn()
+                succeeded = True
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                throttled = True
+                self._count("throttled")
+                retry_after = retry_after_seconds(e)
+            finally:
+                self.concurrency.release(throttled=throttled, succeeded=succeeded)
+            if not throttled:
+                actual = usage_tokens(response)
+                if actual is not None:
+                    for bucket in self.token_buckets:
+                        bucket.adjust(actual - estimated_tokens)
+                return response
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt, retry_after)
+                print(f"RateLimiter[{self.name}]: rate limited, retrying in {delay:.2f}s "
+                      f"(attempt {attempt + 1}/{self.max_retries}).")
+                self._count("retries")
+                time.sleep(delay)
+        self._count("failed")
+        raise RateLimitExceeded(f"{self.name} still rate limited after {self.max_retries} retries")
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return dict(
+            stats,
+            queue_depth=self.concurrency.waiting,
+            in_flight=self.concurrency.in_flight,
+            concurrency_limit=int(self.concurrency.limit),
+        )
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read Retry-After (seconds or HTTP date) or retry-after-ms from an error's HTTP response, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # Neither seconds nor an HTTP date: ignore it and fall back to plain backoff.
+        return None
+    return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+def _load_limits(processes: int = LLM_RATE_LIMIT_PROCESSES) -> Dict[str, Dict[str, float]]:
+    """The configured limits, with request and token budgets divided between the serving processes."""
+    limits = {key: dict(value) for key, value in DEFAULT_RATE_LIMITS.items()}
+    for key, value in json.loads(os.getenv("LLM_RATE_LIMITS", "{}")).items():
+        limits.setdefault(key, {}).update(value)
+    for value in limits.values():
+        for budget in ("rpm", "tpm"):
+            if budget in value:
+                value[budget] = value[budget] / max(1, processes)
+    return limits
+
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_provider_buckets: Dict[str, Tuple[List[TokenBucket], List[TokenBucket]]] = {}
+_registry_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, model: str) -> RateLimiter:
+    """
+    Return the process-wide limiter for a provider and model.
+
+    Models of one provider share the provider's buckets; a "provider:model" entry in the limits
+    adds buckets that only that model draws from, plus its own concurrency limit.
+    """
+    key = (provider, model)
+    with _registry_lock:
+        if key in _limiters:
+            return _limiters[key]
+        limits = _load_limits()
+        provider_limits = limits.get(provider, {})
+        if provider not in _provider_buckets:
+            _provider_buckets[provider] = (
+                [TokenBucket(provider_limits["rpm"])] if "rpm" in provider_limits else [],
+                [TokenBucket(provider_limits["tpm"])] if "tpm" in provider_limits else [],
+            )
+        request_buckets, token_buckets = (list(buckets) for buckets in _provider_buckets[provider])
+        model_limits = limits.get(f"{provider}:{model}", {})
+        if "rpm" in model_limits:
+            request_buckets.append(TokenBucket(model_limits["rpm"]))
+        if "tpm" in model_limits:
+            token_buckets.append(TokenBucket(model_limits["tpm"]))
+        max_concurrency = int(model_limits.get("max_concurrency", provider_limits.get("max_concurrency", 8)))
+        limiter = RateLimiter(f"{provider}:{model}", request_buckets, token_buckets,
+                              AIMDConcurrencyLimiter(max_concurrency))
+        _limiters[key] = limiter
+        return limiter
+
+
+def get_rate_limit_metrics() -> Dict[str, Dict[str, Any]]:
+    """Metrics for every limiter created in this process, keyed by "provider:model"."""
+    with _registry_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.metrics() for limiter in limiters}
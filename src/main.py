@@ -15,6 +15,7 @@ from agent_core import DentalAgent
 # Import both handlers
 from llm.gpt_handler import GPTHandler
 from llm.gemini_handler import GeminiHandler
+from llm_handler import LLMHandler
 
 # Load environment variables from .env file
 load_dotenv()
@@ -29,6 +30,8 @@ def get_llm_handler():
         return GPTHandler(api_key=openai_api_key)
     elif llm_provider == "gemini":
         return GeminiHandler(api_key=gemini_api_key)
+    elif llm_provider == "mock":
+        return LLMHandler()
     else:
         raise ValueError(f"Unknown LLM_PROVIDER: {llm_provider}")
 
@@ -57,8 +60,8 @@ def run_prototype_simulation():
         # Try to print the event link if using Google Calendar
         if hasattr(scheduler_handler, 'google_handler'):
             details = scheduler_handler.get_appointment_details(appt_id)
-            if details and 'htmlLink' in details:
-                print(f"View your appointment in Google Calendar: {details['htmlLink']}")
+            if details and details.html_link:
+                print(f"View your appointment in Google Calendar: {details.html_link}")
     else:
         print("Time slot not available for booking.")
 
@@ -0,0 +1,113 @@
+"""
+Message Templates module for the Dental Agent Prototype.
+This module holds the patient-facing message texts per message type and locale. Each template is
+compiled once into literal and variable segments, which are also the chunks used for TTS caching.
+"""
+
+import os
+import string
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_LOCALE = os.getenv("DEFAULT_LOCALE", "en")
+
+TEMPLATES: Dict[str, Dict[str, str]] = {
+    "en": {
+        "greeting": "Hello! This is the Dental Agent prototype. How can I assist you today?",
+        "leave_message": "Hello! Please leave a message after the beep. Press any key when done.",
+        "no_recording": "We did not receive a recording. Goodbye!",
+        "transcription_failed": "Sorry, we could not transcribe your message.",
+        "you_said": "You said: $transcript",
+        "appointment_confirmed": "Appointment confirmed for $patient_name at $time. Your appointment ID is $appointment_id.",
+        "appointment_unavailable": "Sorry, $time is not available. Would you like to try another time?",
+        "appointment_unavailable_offer": "Sorry, $time is not available. The next open times are $slots. Would you like one of those?",
+        "time_unclear": "Sorry, I could not tell which time you meant by \"$time\". Please give a specific date and time, for example May 3 at 2 PM.",
+        "appointment_changed": "Appointment $appointment_id change to $time successful.",
+        "appointment_change_failed": "Appointment $appointment_id change to $time failed.",
+        "appointment_cancelled": "Appointment $appointment_id cancellation successful.",
+        "appointment_cancel_failed": "Appointment $appointment_id cancellation failed.",
+        "no_show_follow_up": "We missed you for your appointment $appointment_id ($time). Please call us to reschedule.",
+    },
+    "es": {
+        "greeting": "¡Hola! Este es el prototipo del Agente Dental. ¿En qué puedo ayudarle hoy?",
+        "leave_message": "¡Hola! Por favor deje un mensaje después del tono. Presione cualquier tecla al terminar.",
+        "no_recording": "No recibimos ninguna grabación. ¡Adiós!",
+        "transcription_failed": "Lo sentimos, no pudimos transcribir su mensaje.",
+        "you_said": "Usted dijo: $transcript",
+        "appointment_confirmed": "Cita confirmada para $patient_name el $time. Su número de cita es $appointment_id.",
+        "appointment_unavailable": "Lo sentimos, $time no está disponible. ¿Desea probar otro horario?",
+        "appointment_unavailable_offer": "Lo sentimos, $time no está disponible. Los próximos horarios libres son $slots. ¿Le conviene alguno?",
+        "time_unclear": "Lo sentimos, no entendimos a qué hora se refiere con \"$time\". Por favor indique una fecha y hora concretas, por ejemplo el 3 de mayo a las 2 PM.",
+        "appointment_changed": "El cambio de la cita $appointment_id a $time se realizó con éxito.",
+        "appointment_change_failed": "No se pudo cambiar la cita $appointment_id a $time.",
+        "appointment_cancelled": "La cita $appointment_id fue cancelada con éxito.",
+        "appointment_cancel_failed": "No se pudo cancelar la cita $appointment_id.",
+        "no_show_follow_up": "Le extrañamos en su cita $appointment_id ($time). Por favor llámenos para reprogramarla.",
+    },
+}
+
+# A compiled template is a list of (text, is_variable) segments; for variables, text is the name.
+Segments = List[Tuple[str, bool]]
+
+
+def _compile(template: str) -> Segments:
+    segments = []
+    position = 0
+    for match in string.Template.pattern.finditer(template):
+        literal = template[position:match.start()]
+        name = match.group("named") or match.group("braced")
+        if match.group("escaped") is not None:
+            literal += "$"
+        if literal:
+            segments.append((literal, False))
+        if name:
+            segments.append((name, True))
+        position = match.end()
+    if template[position:]:
+        segments.append((template[position:], False))
+    return segments
+
+
+_COMPILED: Dict[Tuple[str, str], Segments] = {
+    (message_type, locale): _compile(template)
+    for locale, templates in TEMPLATES.items()
+    for message_type, template in templates.items()
+}
+
+
+def _segments(message_type: str, locale: Optional[str]) -> Segments:
+    locale = locale or DEFAULT_LOCALE
+    compiled = _COMPILED.get((message_type, locale)) or _COMPILED.get((message_type, DEFAULT_LOCALE))
+    if compiled is None:
+        raise KeyError(f"Unknown message type: {message_type}")
+    return compiled
+
+
+def render(message_type: str, locale: Optional[str] = None, **values) -> str:
+    """Render a message, falling back to DEFAULT_LOCALE when the locale has no such template."""
+    return "".join(str(values[text]) if is_variable else text for text, is_variable in _segments(message_type, locale))
+
+
+def render_chunks(message_type: str, locale: Optional[str] = None, **values) -> List[Tuple[str, bool]]:
+    """
+    Render a message as speakable chunks, each flagged True if it is fixed template text.
+
+    Fixed chunks are the same on every call, so their synthesized audio can be cached and reused;
+    only the variable chunks (names, times, IDs) differ between calls.
+    """
+    chunks = []
+    for text, is_variable in _segments(message_type, locale):
+        text = str(values[text]).strip() if is_variable else text.strip()
+        # Bare punctuation between variables (e.g. the final ".") is not worth its own audio clip.
+        if any(c.isalnum() for c in text):
+            chunks.append((text, not is_variable))
+    return chunks
+
+
+def static_phrases(locale: Optional[str] = None) -> List[str]:
+    """All fixed chunks of every template in a locale, for warming the TTS cache."""
+    locale = locale or DEFAULT_LOCALE
+    return [
+        text.strip()
+        for (message_type, template_locale), segments in _COMPILED.items() if template_locale == locale
+        for text, is_variable in segments if not is_variable and any(c.isalnum() for c in text)
+    ]
@@ -18,8 +18,8 @@ def main():
     if success:
         print("Modification successful!")
         details = scheduler.get_appointment_details(appt_id)
-        if details and 'htmlLink' in details:
-            print(f"View modified appointment: {details['htmlLink']}")
+        if details and details.html_link:
+            print(f"View modified appointment: {details.html_link}")
     else:
         print("Modification failed.")
 
@@ -0,0 +1,129 @@
+"""
+No-Show Batch Job for the Dental Agent Prototype.
+
+Finds every appointment in a date range that is still 'confirmed' a grace period after its start,
+marks it as a no-show in one batched write, and sends one follow-up per patient in bulk.
+A checkpoint file records how far the job got, so a rerun only looks at newer appointments.
+
+Appointment statuses move confirmed -> no_show -> no_show_notified; a run that dies after marking
+but before sending picks the 'no_show' appointments up again on the next run. Only patients whose
+follow-up was accepted are marked notified, and the checkpoint stops at the earliest appointment
+whose follow-up failed, so the next run retries it.
+"""
+
+import argparse
+import datetime
+import json
+import os
+from typing import Dict, List, Optional
+
+from message_templates import render
+from records import Appointment
+from slot_reservations import to_epoch
+
+NO_SHOW_CHECKPOINT_PATH = os.getenv("NO_SHOW_CHECKPOINT_PATH", "no_show_checkpoint.json")
+NO_SHOW_GRACE_MINUTES = int(os.getenv("NO_SHOW_GRACE_MINUTES", "15"))
+NO_SHOW_LOOKBACK_DAYS = int(os.getenv("NO_SHOW_LOOKBACK_DAYS", "1"))
+
+
+class NoShowBatchJob:
+    def __init__(self, scheduler_handler, comm_handler, checkpoint_path: str = NO_SHOW_CHECKPOINT_PATH,
+                 grace_minutes: int = NO_SHOW_GRACE_MINUTES, lookback_days: int = NO_SHOW_LOOKBACK_DAYS):
+        self.scheduler_handler = scheduler_handler
+        self.comm_handler = comm_handler
+        self.checkpoint_path = checkpoint_path
+        self.grace = datetime.timedelta(minutes=grace_minutes)
+        self.lookback = datetime.timedelta(days=lookback_days)
+
+    def _load_checkpoint(self) -> Optional[str]:
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as f:
+            return json.load(f).get("watermark")
+
+    def _save_checkpoint(self, watermark: str) -> None:
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"watermark": watermark}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def run(self, start_time: Optional[str] = None, end_time: Optional[str] = None) -> Dict[str, int]:
+        """
+        Process appointments starting in [start_time, end_time).
+
+        start_time defaults to the checkpoint (or NO_SHOW_LOOKBACK_DAYS ago), end_time to now minus the grace period.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        end_time = end_time or (now - self.grace).isoformat()
+        start_time = start_time or self._load_checkpoint() or (now - self.lookback).isoformat()
+        stats = {"appointments": 0, "marked": 0, "patients": 0, "sent": 0, "failed": 0}
+        start_ts, end_ts = to_epoch(start_time), to_epoch(end_time)
+        if start_ts >= end_ts:
+            print(f"NoShowBatchJob: Nothing to do, checkpoint {start_time} is already past {end_time}.")
+            return stats
+
+        print(f"NoShowBatchJob: Processing appointments from {start_time} to {end_time}.")
+        # One range query for both statuses; on Google that is a single paginated scan.
+        pending = [
+            appt
+            for appt in self.scheduler_handler.list_appointments(start_time, end_time, ("confirmed", "no_show"))
+            if _starts_in(appt, start_ts, end_ts)
+        ]
+        stats["appointments"] = len(pending)
+
+        newly_missed = [appt.id for appt in pending if appt.status == "confirmed"]
+        if newly_missed:
+            stats["marked"] = self.scheduler_handler.set_appointment_status(newly_missed, "no_show")
+
+        # One follow-up per patient, about their most recent missed appointment.
+        latest: Dict[str, Appointment] = {}
+        for appt in pending:
+            contact = appt.patient_contact
+            if contact and (contact not in latest or appt.start_ts > latest[contact].start_ts):
+                latest[contact] = appt
+        stats["patients"] = len(latest)
+
+        messages: Dict[str, List] = {"EMAIL": [], "SMS": []}
+        for contact, appt in latest.items():
+            channel = "EMAIL" if "@" in contact else "SMS"
+            messages[channel].append((contact, render("no_show_follow_up", appointment_id=appt.id, time=appt.time)))
+        delivered = set()
+        for channel, batch in messages.items():
+            if batch:
+                delivered.update(self.comm_handler.send_bulk_messages(batch, channel))
+        stats["sent"] = len(delivered)
+        stats["failed"] = len(latest) - len(delivered)
+
+        notified = [appt.id for appt in pending if appt.patient_contact in delivered]
+        if notified:
+            self.scheduler_handler.set_appointment_status(notified, "no_show_notified")
+        # Failed follow-ups stay 'no_show'; keep them inside the next run's range.
+        failed = [appt for appt in pending if appt.patient_contact and appt.patient_contact not in delivered]
+        watermark = min(failed, key=lambda appt: appt.start_ts).time if failed else end_time
+        self._save_checkpoint(watermark)
+        print(f"NoShowBatchJob: {stats}")
+        return stats
+
+
+def _starts_in(appt: Appointment, start_ts: float, end_ts: float) -> bool:
+    # The mock scheduler ignores the query range and may hold free-text times such as "tomorrow 2 PM".
+    return appt.start_ts is not None and start_ts <= appt.start_ts < end_ts
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    from communication_handler import CommunicationHandler
+    from scheduler_handler import SchedulerHandler
+
+    parser = argparse.ArgumentParser(description="Mark no-shows and send follow-ups in bulk.")
+    parser.add_argument("--start", help="ISO8601 start of the range (default: last checkpoint)")
+    parser.add_argument("--end", help="ISO8601 end of the range (default: now minus the grace period)")
+    args = parser.parse_args()
+
+    job = NoShowBatchJob(SchedulerHandler(), CommunicationHandler())
+    job.run(args.start, args.end)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Patient Directory module for the Dental Agent Prototype.
+This class keeps patients in the shared SQLite database and serves caller-ID, email and fuzzy
+name lookups from an in-memory index that is loaded lazily and refreshed when another worker writes.
+"""
+
+import difflib
+import json
+import os
+import re
+import sqlite3
+import threading
+import weakref
+from typing import Dict, List, Optional
+
+from records import Patient
+
+# Patients live next to the appointment book by default, so workers share one database file. The
+# mock scheduler keeps its appointments in memory, and so does the directory unless a path is set.
+_PERSISTENT_SCHEDULER = os.getenv("SCHEDULER_PROVIDER", "mock").lower() in ("google", "sqlite")
+PATIENT_DB_PATH = (os.getenv("PATIENT_DB_PATH") or os.getenv("APPOINTMENT_DB_PATH")
+                   or ("appointments.db" if _PERSISTENT_SCHEDULER else ":memory:"))
+DEFAULT_COUNTRY_CODE = os.getenv("DEFAULT_COUNTRY_CODE", "1")
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS patients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id TEXT UNIQUE,
+        name TEXT,
+        phone TEXT,
+        email TEXT,
+        info TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_patients_phone ON patients (phone);
+    CREATE INDEX IF NOT EXISTS idx_patients_email ON patients (email);
+"""
+
+
+def normalize_phone(raw: Optional[str], default_country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    """Normalize a phone number to E.164 (e.g. '(555) 010-0000' -> '+15550100000')."""
+    if not raw:
+        return None
+    raw = raw.strip()
+    digits = re.sub(r"\D", "", raw)
+    if raw.startswith("+"):
+        return f"+{digits}" if 8 <= len(digits) <= 15 else None
+    if raw.startswith("00") and len(digits) > 10:
+        return f"+{digits[2:]}"
+    if default_country_code == "1" and len(digits) == 11 and digits.startswith("1"):
+        return f"+{digits}"
+    if 7 <= len(digits) <= 10:
+        return f"+{default_country_code}{digits}"
+    return None
+
+
+def normalize_email(raw: Optional[str]) -> Optional[str]:
+    if not raw or "@" not in raw:
+        return None
+    return raw.strip().lower()
+
+
+def normalize_contact(raw: Optional[str]) -> Optional[str]:
+    """Normalize a contact that may be either an email address or a phone number."""
+    return normalize_email(raw) or normalize_phone(raw)
+
+
+class _PatientIndex:
+    """In-memory lookups by patient ID, phone, email and lowercased name."""
+
+    __slots__ = ("patients", "by_phone", "by_email", "by_name")
+
+    def __init__(self):
+        self.patients: Dict[str, Patient] = {}
+        self.by_phone: Dict[str, str] = {}
+        self.by_email: Dict[str, str] = {}
+        self.by_name: Dict[str, List[str]] = {}
+
+    def add(self, patient: Patient) -> None:
+        patient_id = patient.patient_id
+        previous = self.patients.get(patient_id)
+        if previous:
+            self.by_phone.pop(previous.phone, None)
+            self.by_email.pop(previous.email, None)
+            if previous.name:
+                self.by_name[previous.name.lower()].remove(patient_id)
+        self.patients[patient_id] = patient
+        if patient.phone:
+            self.by_phone[patient.phone] = patient_id
+        if patient.email:
+            self.by_email[patient.email] = patient_id
+        if patient.name:
+            self.by_name.setdefault(patient.name.lower(), []).append(patient_id)
+
+
+# A forked worker reopens the connection of every live directory. One hook for all of them; a hook
+# per instance would keep each one alive.
+_live_directories: "weakref.WeakSet[PatientDirectory]" = weakref.WeakSet()
+
+
+def _reopen_after_fork() -> None:
+    for directory in list(_live_directories):
+        directory._reopen_after_fork()
+
+
+os.register_at_fork(after_in_child=_reopen_after_fork)
+
+
+class PatientDirectory:
+    def __init__(self, db_path: str = PATIENT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._data_version = None
+        _live_directories.add(self)
+        self._index = _PatientIndex()
+        print(f"PatientDirectory initialized ({db_path}).")
+
+    def _reopen_after_fork(self) -> None:
+        # A forked worker inherits the loaded index copy-on-write but needs its own connection.
+        # data_version is per connection, so re-baseline it rather than reloading the index.
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        if self.db_path == ":memory:":
+            # A fresh, empty database: copy the inherited patients in, so new IDs do not collide.
+            self._conn.executescript(SCHEMA)
+            self._conn.executemany(
+                "INSERT INTO patients (id, patient_id, name, phone, email, info) VALUES (?, ?, ?, ?, ?, ?)",
+                [(int(p.patient_id[3:]), p.patient_id, p.name, p.phone, p.email, json.dumps(p.to_info()))
+                 for p in self._index.patients.values()]
+            )
+        if self._data_version is not None:
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def load(self) -> None:
+        """Load the index now instead of on the first lookup, e.g. before forking workers."""
+        self._ensure_loaded()
+
+    def _ensure_loaded(self) -> None:
+        # PRAGMA data_version changes whenever another connection commits, so the index is only
+        # rebuilt after some other worker actually wrote to the patients database.
+        with self._lock:
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return
+            # Built aside and swapped in with one assignment, so lookups running without the lock
+            # see either the old index or the new one, never a half-filled one.
+            index = _PatientIndex()
+            for patient_id, info in self._conn.execute("SELECT patient_id, info FROM patients"):
+                index.add(Patient.from_info(patient_id, json.loads(info)))
+            self._index = index
+            self._data_version = data_version
+            print(f"PatientDirectory: Loaded {len(index.patients)} patients.")
+
+    def upsert_patient(self, name: str, phone: str = None, email: str = None, **extra) -> str:
+        """Add a patient, or update the one with the same phone or email; returns the patient ID."""
+        info = dict(extra, name=name, phone=normalize_phone(phone), email=normalize_email(email))
+        with self._lock:
+            # Look up and write in one write transaction, so two workers importing the same patient
+            # cannot both miss the lookup and insert a duplicate. The in-memory index may be stale.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._conn.execute(
+                    "SELECT patient_id, info FROM patients WHERE phone = ? OR email = ? "
+                    "ORDER BY phone IS NOT ? LIMIT 1",
+                    (info["phone"], info["email"], info["phone"])
+                ).fetchone()
+                if existing:
+                    patient_id = existing[0]
+                    # Fields left out of this call keep their stored values.
+                    info = dict(json.loads(existing[1]), **{k: v for k, v in info.items() if v is not None})
+                    self._conn.execute(
+                        "UPDATE patients SET name = ?, phone = ?, email = ?, info = ? WHERE patient_id = ?",
+                        (name, info["phone"], info["email"], json.dumps(info), patient_id)
+                    )
+                else:
+                    cursor = self._conn.execute(
+                        "INSERT INTO patients (name, phone, email, info) VALUES (?, ?, ?, ?)",
+                        (name, info["phone"], info["email"], json.dumps(info))
+                    )
+                    patient_id = f"PAT{cursor.lastrowid:05d}"
+                    self._conn.execute("UPDATE patients SET patient_id = ? WHERE id = ?",
+                                       (patient_id, cursor.lastrowid))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            # Our own commits do not bump data_version, so keep the in-memory index in step here.
+            self._index.add(Patient.from_info(patient_id, info))
+        return patient_id
+
+    def get_patient(self, patient_id: str) -> Optional[Patient]:
+        self._ensure_loaded()
+        return self._index.patients.get(patient_id)
+
+    def lookup_contact(self, contact: Optional[str]) -> Optional[Patient]:
+        """Resolve a caller ID, phone number or email address to a patient."""
+        if not contact:
+            return None
+        self._ensure_loaded()
+        email = normalize_email(contact)
+        index = self._index
+        patient_id = index.by_email.get(email) if email else index.by_phone.get(normalize_phone(contact))
+        return index.patients.get(patient_id) if patient_id else None
+
+    def search_name(self, query: str, limit: int = 5, cutoff: float = 0.6) -> List[Patient]:
+        """Return patients whose name matches query exactly or approximately, best match first."""
+        self._ensure_loaded()
+        query = query.strip().lower()
+        index = self._index
+        names = difflib.get_close_matches(query, index.by_name.keys(), n=limit, cutoff=cutoff)
+        if query in index.by_name and query not in names:
+            names.insert(0, query)
+        return [index.patients[pid] for name in names for pid in index.by_name[name]][:limit]
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_patient_directory() -> PatientDirectory:
+    """Return the process-wide PatientDirectory, creating it on first use."""
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                _directory = PatientDirectory()
+    return _directory
@@ -0,0 +1,394 @@
+"""
+Profiler module for the Dental Agent Prototype.
+This module provides an opt-in sampling profiler for individual requests. A profiled request gets
+periodic stack samples from the threads working on it and wall-clock spans around the hot paths
+(voice webhooks, DentalAgent steps, LLM calls, Google Calendar calls), written to PROFILE_DIR as
+speedscope JSON or collapsed stacks when the request finishes.
+
+Requests are profiled when they carry the PROFILE_HEADER header set to PROFILE_TOKEN (the header
+is ignored while no token is configured), or by PROFILE_SAMPLE_RATE, which is decided per
+conversation so every request of a sampled call is captured. Unprofiled requests only pay for a
+context variable lookup at each span. PROFILE_DIR keeps the newest PROFILE_MAX_FILES files.
+"""
+
+import contextlib
+import contextvars
+import copy
+import functools
+import hmac
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_FORMAT = os.getenv("PROFILE_FORMAT", "speedscope").lower()  # speedscope or collapsed
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+MAX_STACK_DEPTH = 128
+
+_active_profile: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("active_profile", default=None)
+_span_path: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar("span_path", default=())
+_sequence = itertools.count(1)
+
+Frame = Tuple[str, str, int]  # (function, file, first line)
+
+
+class Profile:
+    def __init__(self, name: str, conversation_id: Optional[str] = None):
+        self.name = name
+        self.conversation_id = conversation_id
+        self.started = time.perf_counter()
+        self.duration = None
+        self.finished = False
+        self._lock = threading.Lock()
+        self._threads: Counter = Counter()  # thread id -> open registrations
+        self._thread_names: Dict[int, str] = {}
+        self.samples: Dict[int, List[Tuple[Tuple[Frame, ...], float]]] = {}  # per thread, in time order
+        self.span_events: Dict[int, List[Tuple[str, str, float]]] = {}  # per thread: ("O"/"C", name, at)
+        self.span_totals: Counter = Counter()  # span path -> seconds
+
+    def register_thread(self) -> int:
+        thread = threading.current_thread()
+        with self._lock:
+            self._threads[thread.ident] += 1
+            self._thread_names[thread.ident] = thread.name
+        return thread.ident
+
+    def unregister_thread(self, thread_id: int) -> None:
+        with self._lock:
+            self._threads[thread_id] -= 1
+            if self._threads[thread_id] <= 0:
+                del self._threads[thread_id]
+
+    def _sample(self, frames: Dict[int, object], at: float) -> None:
+        with self._lock:
+            thread_ids = list(self._threads)
+        for thread_id in thread_ids:
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            self.samples.setdefault(thread_id, []).append((tuple(reversed(stack)), at))
+
+    def _span_event(self, thread_id: int, kind: str, name: str, at: float) -> None:
+        with self._lock:
+            self.span_events.setdefault(thread_id, []).append((kind, name, at - self.started))
+
+    def _span_done(self, path: Tuple[str, ...], seconds: float) -> None:
+        with self._lock:
+            self.span_totals[path] += seconds
+
+    def breakdown(self) -> Dict[str, float]:
+        """Wall-clock milliseconds per span path, e.g. {"POST /recording;agent.turn;llm.openai": 812.4}."""
+        with self._lock:
+            totals = self.span_totals.most_common()
+        return {";".join(path): seconds * 1000 for path, seconds in totals}
+
+    def frozen(self) -> "Profile":
+        """
+        A copy to serialize. Threads that outlive the request (e.g. background sends) can still close
+        spans on this profile while it is being written.
+        """
+        with self._lock:
+            frozen = copy.copy(self)
+            frozen._lock = threading.Lock()
+            frozen._threads = Counter(self._threads)
+            frozen._thread_names = dict(self._thread_names)
+            frozen.samples = {thread_id: list(samples) for thread_id, samples in self.samples.items()}
+            frozen.span_events = {thread_id: list(events) for thread_id, events in self.span_events.items()}
+            frozen.span_totals = Counter(self.span_totals)
+        return frozen
+
+
+class _Sampler(threading.Thread):
+    """One daemon thread per process that samples the threads of every active profile."""
+
+    def __init__(self, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.profiles: List[Profile] = []
+        self.cond = threading.Condition()
+        self.pass_lock = threading.Lock()
+
+    def run(self) -> None:
+        while True:
+            with self.cond:
+                while not self.profiles:
+                    self.cond.wait()
+                profiles = list(self.profiles)
+            with self.pass_lock:
+                frames = sys._current_frames()
+                at = time.perf_counter()
+                for profile in profiles:
+                    profile._sample(frames, at)
+                del frames
+            time.sleep(self.interval)
+
+
+_sampler: Optional[_Sampler] = None
+_sampler_lock = threading.Lock()
+
+
+def _get_sampler() -> _Sampler:
+    global _sampler
+    with _sampler_lock:
+        # A forked worker does not inherit the thread, so start one where it is missing.
+        if _sampler is None or not _sampler.is_alive():
+            _sampler = _Sampler(PROFILE_INTERVAL_MS / 1000.0)
+            _sampler.start()
+        return _sampler
+
+
+def profile_requested(header_value: Optional[str], token: Optional[str] = PROFILE_TOKEN) -> bool:
+    """Whether a request's PROFILE_HEADER value asks for a profile: it must match the shared token."""
+    if not token or not header_value:
+        return False
+    return hmac.compare_digest(header_value.encode("utf-8"), token.encode("utf-8"))
+
+
+def should_profile(conversation_id: Optional[str] = None, forced: bool = False) -> bool:
+    """Profile when forced (e.g. by header) or, at PROFILE_SAMPLE_RATE, for a stable subset of conversations."""
+    if forced:
+        return True
+    if PROFILE_SAMPLE_RATE <= 0:
+        return False
+    if conversation_id:
+        # crc32 rather than hash(), so every worker process samples the same conversations.
+        return zlib.crc32(conversation_id.encode("utf-8")) % 10000 < PROFILE_SAMPLE_RATE * 10000
+    return zlib.crc32(os.urandom(4)) % 10000 < PROFILE_SAMPLE_RATE * 10000
+
+
+def start_profile(name: str, conversation_id: Optional[str] = None) -> Tuple[Profile, list]:
+    """Start profiling the current context; pass the returned handle to finish_profile()."""
+    profile = Profile(name, conversation_id)
+    tokens = [_active_profile.set(profile), _span_path.set((name,))]
+    thread_id = profile.register_thread()
+    profile._span_event(thread_id, "O", name, profile.started)
+    sampler = _get_sampler()
+    with sampler.cond:
+        sampler.profiles.append(profile)
+        sampler.cond.notify()
+    return profile, [thread_id] + tokens
+
+
+def finish_profile(profile: Profile, handle: list, directory: str = PROFILE_DIR) -> Optional[str]:
+    """Stop profiling, restore the context and write the profile; returns the file path."""
+    thread_id, profile_token, path_token = handle
+    sampler = _get_sampler()
+    with sampler.cond:
+        sampler.profiles.remove(profile)
+    with sampler.pass_lock:
+        pass  # Let a sampling pass that already picked up this profile finish.
+    end = time.perf_counter()
+    profile._span_event(thread_id, "C", profile.name, end)
+    profile._span_done((profile.name,), end - profile.started)
+    profile.duration = end - profile.started
+    profile.finished = True
+    _span_path.reset(path_token)
+    _active_profile.reset(profile_token)
+    try:
+        return write_profile(profile.frozen(), directory)
+    except OSError as e:
+        print(f"Profiler: Could not write profile for {profile.name}: {e}")
+        return None
+
+
+@contextlib.contextmanager
+def profile_request(name: str, conversation_id: Optional[str] = None, forced: bool = False):
+    """Profile the enclosed block if should_profile() says so; yields the Profile or None."""
+    if _active_profile.get() is not None or not should_profile(conversation_id, forced):
+        yield None
+        return
+    profile, handle = start_profile(name, conversation_id)
+    try:
+        yield profile
+    finally:
+        finish_profile(profile, handle)
+
+
+@contextlib.contextmanager
+def _span(profile: Profile, name: str):
+    path = _span_path.get() + (name,)
+    token = _span_path.set(path)
+    # Threads join the sample set only while they work for the profiled request.
+    thread_id = profile.register_thread()
+    start = time.perf_counter()
+    profile._span_event(thread_id, "O", name, start)
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        profile._span_event(thread_id, "C", name, end)
+        profile._span_done(path, end - start)
+        profile.unregister_thread(thread_id)
+        _span_path.reset(token)
+
+
+def span(name: str):
+    """Time the enclosed block as a named span of the active profile; a no-op when none is active."""
+    profile = _active_profile.get()
+    if profile is None or profile.finished:
+        return contextlib.nullcontext()
+    return _span(profile, name)
+
+
+def profiled(name: str):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profile = _active_profile.get()
+            if profile is None or profile.finished:
+                return fn(*args, **kwargs)
+            with _span(profile, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_profile(profile: Profile, directory: str = PROFILE_DIR) -> str:
+    os.makedirs(directory, exist_ok=True)
+    label = re.sub(r"[^A-Za-z0-9_.-]+", "_", profile.conversation_id or profile.name).strip("_") or "request"
+    base = os.path.join(directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{label}-{os.getpid()}-{next(_sequence)}")
+    if PROFILE_FORMAT == "collapsed":
+        path = base + ".collapsed"
+        with open(path, "w") as f:
+            f.write(to_collapsed(profile))
+        with open(base + ".spans.collapsed", "w") as f:
+            f.write(spans_to_collapsed(profile))
+    else:
+        path = base + ".speedscope.json"
+        with open(path, "w") as f:
+            json.dump(to_speedscope(profile), f)
+    print(f"Profiler: Wrote {path} ({profile.duration * 1000:.0f} ms, "
+          f"{sum(len(s) for s in profile.samples.values())} samples).")
+    prune_profiles(directory)
+    return path
+
+
+def prune_profiles(directory: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES) -> int:
+    """Remove the oldest files beyond max_files from the profile directory; returns how many."""
+    files = []
+    for entry in os.scandir(directory):
+        try:
+            files.append((entry.stat().st_mtime, entry.path))
+        except FileNotFoundError:
+            pass  # Removed by another worker
+    files.sort(reverse=True)
+    removed = 0
+    for _, path in files[max_files:]:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def _frame_label(frame: Frame) -> str:
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def to_collapsed(profile: Profile) -> str:
+    """Brendan Gregg's collapsed-stack format: 'thread;outer;...;inner count' per unique stack."""
+    counts: Counter = Counter()
+    for thread_id, samples in profile.samples.items():
+        thread = profile._thread_names.get(thread_id, str(thread_id))
+        for stack, _ in samples:
+            counts[";".join([thread] + [_frame_label(frame) for frame in stack])] += 1
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+def _balanced(events: List[Tuple[str, str, float]], end: float) -> List[Tuple[str, str, float]]:
+    # A background step (e.g. a send) can still be running when the request finishes: drop its
+    # late events and close anything left open at the end, as speedscope needs nested events.
+    balanced, open_spans = [], []
+    for kind, name, at in events:
+        if at > end:
+            continue
+        if kind == "O":
+            open_spans.append(name)
+        elif open_spans and open_spans[-1] == name:
+            open_spans.pop()
+        else:
+            continue
+        balanced.append((kind, name, at))
+    balanced.extend(("C", name, end) for name in reversed(open_spans))
+    return balanced
+
+
+def spans_to_collapsed(profile: Profile) -> str:
+    """Span paths in collapsed-stack format, weighted by wall-clock microseconds of self time."""
+    self_time = Counter(profile.span_totals)
+    for path, seconds in profile.span_totals.items():
+        if len(path) > 1:
+            self_time[path[:-1]] -= seconds
+    # Spans on other threads overlap their parent, so its self time can come out negative.
+    return "".join(f"{';'.join(path)} {max(0, round(seconds * 1e6))}\n" for path, seconds in self_time.most_common())
+
+
+def to_speedscope(profile: Profile) -> dict:
+    """A speedscope file with a sampled profile per thread and an evented profile of the spans per thread."""
+    frames: List[dict] = []
+    frame_index: Dict[object, int] = {}
+
+    def index(key, **frame) -> int:
+        if key not in frame_index:
+            frame_index[key] = len(frames)
+            frames.append(frame)
+        return frame_index[key]
+
+    end_ms = (profile.duration or 0.0) * 1000
+    profiles = []
+    for thread_id, samples in profile.samples.items():
+        thread = profile._thread_names.get(thread_id, str(thread_id))
+        stacks, weights = [], []
+        previous = None
+        for stack, at in samples:
+            # Weight by the time since the thread's previous sample, which includes sampling overhead,
+            # capped so the gap while a thread was not working for the request is not counted.
+            weight = PROFILE_INTERVAL_MS
+            if previous is not None:
+                weight = min((at - previous) * 1000, 4 * PROFILE_INTERVAL_MS)
+            previous = at
+            indices = [index(frame, name=frame[0], file=frame[1], line=frame[2]) for frame in stack]
+            if stacks and stacks[-1] == indices:
+                weights[-1] += weight
+            else:
+                stacks.append(indices)
+                weights.append(weight)
+        profiles.append({
+            "type": "sampled", "name": f"{profile.name} [{thread}] samples", "unit": "milliseconds",
+            "startValue": 0, "endValue": sum(weights), "samples": stacks, "weights": weights,
+        })
+    for thread_id, events in profile.span_events.items():
+        thread = profile._thread_names.get(thread_id, str(thread_id))
+        profiles.append({
+            "type": "evented", "name": f"{profile.name} [{thread}] spans", "unit": "milliseconds",
+            "startValue": 0, "endValue": end_ms,
+            "events": [{"type": kind, "frame": index(("span", name), name=name), "at": at * 1000}
+                       for kind, name, at in _balanced(events, profile.duration or 0.0)],
+        })
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": f"{profile.name} {profile.conversation_id or ''}".strip(),
+        "exporter": "dental_agent_prototype profiler",
+        "activeProfileIndex": 0,
+        "shared": {"frames": frames},
+        "profiles": profiles,
+    }
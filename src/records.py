@@ -0,0 +1,124 @@
+"""
+Records module for the Dental Agent Prototype.
+This module defines compact, typed records for appointments, patients, conversation turns and
+outbound message deliveries.
+They are slotted dataclasses (no per-instance __dict__), and appointment times are parsed to
+epoch seconds once, when the record is built, instead of on every comparison.
+"""
+
+import time
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from slot_reservations import to_epoch
+
+
+def _epoch_or_none(iso_time: Optional[str]) -> Optional[float]:
+    # The mock scheduler accepts free-text times such as "tomorrow 2 PM", which have no epoch.
+    try:
+        return to_epoch(iso_time)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+@dataclass(slots=True)
+class Appointment:
+    id: str
+    patient_name: str = "Unknown"
+    patient_contact: Optional[str] = None
+    time: str = "Unknown"  # Start as booked: ISO 8601, or free text on the mock scheduler
+    end_time: Optional[str] = None
+    status: str = "confirmed"
+    start_ts: Optional[float] = None
+    end_ts: Optional[float] = None
+    patient_info: Optional[Dict[str, Any]] = None
+    html_link: Optional[str] = None
+
+    def __post_init__(self):
+        if self.start_ts is None:
+            self.start_ts = _epoch_or_none(self.time)
+        if self.end_ts is None:
+            self.end_ts = _epoch_or_none(self.end_time)
+
+    @classmethod
+    def not_found(cls, appointment_id: str) -> "Appointment":
+        return cls(appointment_id, status="not_found")
+
+    @classmethod
+    def from_event(cls, event: Dict) -> "Appointment":
+        """
+        Build a record from a Google Calendar event resource.
+
+        Only the fields the agent uses are kept. The strings are referenced from the API response
+        rather than copied, so the rest of the event can be freed as soon as the caller drops it.
+        """
+        private = event.get('extendedProperties', {}).get('private', {})
+        summary = event.get('summary', '')
+        return cls(
+            id=event.get('id'),
+            patient_name=summary.split(': ', 1)[1] if ': ' in summary else 'Unknown',
+            patient_contact=private.get('patient_contact'),
+            time=event.get('start', {}).get('dateTime'),
+            end_time=event.get('end', {}).get('dateTime'),
+            status='cancelled' if event.get('status') == 'cancelled' else private.get('status', 'confirmed'),
+            html_link=event.get('htmlLink'),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass(slots=True)
+class Patient:
+    patient_id: Optional[str]
+    name: Optional[str]
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    # Any other imported fields; None rather than an empty dict for the usual patient without them.
+    extra: Optional[Dict[str, Any]] = None
+    upcoming_appointments: Optional[List[Appointment]] = None
+
+    @property
+    def contacts(self) -> List[str]:
+        return [contact for contact in (self.phone, self.email) if contact]
+
+    @classmethod
+    def from_info(cls, patient_id: Optional[str], info: Dict[str, Any]) -> "Patient":
+        """Build a record from the JSON stored in the patients table."""
+        info = dict(info)
+        return cls(patient_id, info.pop("name", None), info.pop("phone", None), info.pop("email", None),
+                   info or None)
+
+    def to_info(self) -> Dict[str, Any]:
+        """The JSON stored in the patients table."""
+        return dict(self.extra or {}, name=self.name, phone=self.phone, email=self.email)
+
+
+@dataclass(slots=True)
+class Turn:
+    received_ts: float
+    utterance: Optional[str]
+    intent: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Delivery:
+    contact: Optional[str]
+    message: str
+    channel: str = "SMS"
+    queued_ts: float = field(default_factory=time.time)
+    status: str = "pending"  # pending, sent or failed
+    sent_ts: Optional[float] = None
+    error: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Conversation:
+    conversation_id: str
+    started_ts: float = field(default_factory=time.time)
+    slot_prefetch: Optional[Future] = None
+    patient: Optional[Patient] = None
+    offered_slots: Optional[List[Tuple[str, str]]] = None
+    turns: List[Turn] = field(default_factory=list)
+    deliveries: List[Delivery] = field(default_factory=list)
@@ -0,0 +1,294 @@
+"""
+Offline conversation replay and A/B evaluation for the Dental Agent Prototype.
+
+Recorded inbound communications are replayed through DentalAgent in a process pool, once per
+configuration, with recorded (or stubbed) LLM responses. Outbound messages are captured, never
+sent. Configurations are compared on turn latency, LLM calls and tokens per turn, and how often
+their decisions (intent plus outbound messages) agree with the first configuration.
+
+Recording format (JSONL), one turn per line:
+    {"communication": {"contact": "+15550100000", "message": "..."},
+     "llm_responses": [{"method": "understand_intent", "input": "...", "response": {...}}, ...]}
+
+Set REPLAY_RECORD_PATH when serving to record live traffic in this format.
+
+    python3 src/replay.py recordings.jsonl --configs configs.json --workers 4
+
+configs.json is a list such as:
+    [{"name": "recorded", "llm": "replay"},
+     {"name": "gpt-4o-mini", "llm": "gpt", "model": "gpt-4o-mini"},
+     {"name": "recorded+200ms", "llm": "replay", "llm_latency_ms": 200, "env": {"PREFETCH_DAYS": "1"}}]
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CONFIGS = [
+    {"name": "recorded", "llm": "replay"},
+    {"name": "mock", "llm": "mock"},
+]
+
+
+def _estimate_tokens(value: Any) -> int:
+    text = value if isinstance(value, str) else json.dumps(value)
+    return max(1, len(text) // 4)
+
+
+class RecordingLLMHandler:
+    """Wraps an LLM handler and records each turn's calls and responses to a JSONL file."""
+
+    def __init__(self, llm_handler, path: str):
+        self.llm_handler = llm_handler
+        self.path = path
+        self._local = threading.local()
+        self._file_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def recording(self, communication_input: dict):
+        self._local.calls = []
+        try:
+            yield
+        finally:
+            line = json.dumps({
+                "communication": {k: v for k, v in communication_input.items() if k != "patient"},
+                "llm_responses": self._local.calls,
+            }, default=str)
+            with self._file_lock, open(self.path, "a") as f:
+                f.write(line + "\n")
+            self._local.calls = None
+
+    def _record(self, method: str, value: str, response: Any) -> Any:
+        calls = getattr(self._local, "calls", None)
+        if calls is not None:
+            # Snapshot now; the agent may mutate returned dicts (e.g. intent entities) later in the turn.
+            calls.append({"method": method, "input": value, "response": json.loads(json.dumps(response, default=str))})
+        return response
+
+    def generate_text(self, prompt: str, context: Optional[str] = None) -> str:
+        return self._record("generate_text", prompt, self.llm_handler.generate_text(prompt, context))
+
+    def understand_intent(self, user_input: str) -> Dict[str, Any]:
+        return self._record("understand_intent", user_input, self.llm_handler.understand_intent(user_input))
+
+    def query_knowledge_base(self, question: str) -> str:
+        return self._record("query_knowledge_base", question, self.llm_handler.query_knowledge_base(question))
+
+
+class ReplayLLMHandler:
+    """Serves a turn's recorded responses, falling back to the mock LLMHandler when none was recorded."""
+
+    def __init__(self, latency_ms: float = 0):
+        from llm_handler import LLMHandler
+        self.stub = LLMHandler()
+        self.latency = latency_ms / 1000.0
+        self.responses: List[Dict[str, Any]] = []
+
+    def load_turn(self, responses: List[Dict[str, Any]]) -> None:
+        self.responses = list(responses)
+
+    def _respond(self, method: str, value: str, fallback):
+        time.sleep(self.latency)
+        # Prefer an exact (method, input) match, then the next unused response for the method.
+        for match_input in (True, False):
+            for i, recorded in enumerate(self.responses):
+                if recorded["method"] == method and (not match_input or recorded["input"] == value):
+                    response = self.responses.pop(i)["response"]
+                    # Copy, as the agent may mutate returned dicts.
+                    return json.loads(json.dumps(response))
+        return fallback(value)
+
+    def generate_text(self, prompt: str, context: Optional[str] = None) -> str:
+        return self._respond("generate_text", prompt, lambda p: self.stub.generate_text(p, context))
+
+    def understand_intent(self, user_input: str) -> Dict[str, Any]:
+        return self._respond("understand_intent", user_input, self.stub.understand_intent)
+
+    def query_knowledge_base(self, question: str) -> str:
+        return self._respond("query_knowledge_base", question, self.stub.query_knowledge_base)
+
+
+class CountingLLMHandler:
+    """Counts calls and estimated tokens (about four characters each) made through an LLM handler."""
+
+    def __init__(self, llm_handler):
+        self.llm_handler = llm_handler
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.tokens = 0
+        self.intents: List[str] = []
+
+    def _count(self, value: Any, response: Any) -> Any:
+        self.calls += 1
+        self.tokens += _estimate_tokens(value) + _estimate_tokens(response)
+        return response
+
+    def generate_text(self, prompt: str, context: Optional[str] = None) -> str:
+        return self._count(prompt, self.llm_handler.generate_text(prompt, context))
+
+    def understand_intent(self, user_input: str) -> Dict[str, Any]:
+        response = self._count(user_input, self.llm_handler.understand_intent(user_input))
+        self.intents.append(response.get("intent"))
+        return response
+
+    def query_knowledge_base(self, question: str) -> str:
+        return self._count(question, self.llm_handler.query_knowledge_base(question))
+
+
+class CapturingCommunicationHandler:
+    """Records outbound messages instead of sending them."""
+
+    def __init__(self):
+        self.sent: List[List[str]] = []
+
+    def send_outbound_message(self, target_contact: str, message_body: str, channel: str = "SMS") -> bool:
+        self.sent.append([channel, target_contact, message_body])
+        return True
+
+    def send_bulk_messages(self, messages, channel: str = "SMS") -> List[str]:
+        return [target for target, body in messages if self.send_outbound_message(target, body, channel)]
+
+
+# Per-process state, set up by _init_worker for the configuration this pool replays.
+_worker: Dict[str, Any] = {}
+
+
+def _build_llm_handler(config: Dict[str, Any]):
+    kind = config.get("llm", "replay")
+    if kind == "replay":
+        return ReplayLLMHandler(config.get("llm_latency_ms", 0))
+    if kind == "mock":
+        from llm_handler import LLMHandler
+        return LLMHandler()
+    if kind == "gpt":
+        from llm.gpt_handler import GPTHandler
+        return GPTHandler(api_key=os.getenv("OPENAI_API_KEY"), model_name=config.get("model", "gpt-4"))
+    if kind == "gemini":
+        from llm.gemini_handler import GeminiHandler
+        return GeminiHandler(api_key=os.getenv("GEMINI_API_KEY"), model_name=config.get("model", "gemini-pro"))
+    raise ValueError(f"Unknown llm in replay config: {kind}")
+
+
+def _init_worker(config: Dict[str, Any]) -> None:
+    # Module-level settings (e.g. SCHEDULER_PROVIDER) are read at import, so apply them first.
+    os.environ.update(config.get("env", {}))
+    os.environ.setdefault("SCHEDULER_PROVIDER", "mock")
+    os.environ.setdefault("SLOT_HOLD_DB_PATH", ":memory:")
+    os.environ.setdefault("APPOINTMENT_DB_PATH", ":memory:")
+    from agent_core import DentalAgent
+    from patient_directory import PatientDirectory
+    from scheduler_handler import SchedulerHandler
+
+    raw_llm = _build_llm_handler(config)
+    llm = CountingLLMHandler(raw_llm)
+    comm = CapturingCommunicationHandler()
+    _worker.update(
+        raw_llm=raw_llm, llm=llm, comm=comm,
+        agent=DentalAgent(llm, SchedulerHandler(), comm, patient_directory=PatientDirectory(":memory:")),
+    )
+
+
+def _replay_turn(index: int, record: Dict[str, Any]) -> Dict[str, Any]:
+    raw_llm, llm, comm, agent = (_worker[k] for k in ("raw_llm", "llm", "comm", "agent"))
+    if isinstance(raw_llm, ReplayLLMHandler):
+        raw_llm.load_turn(record.get("llm_responses", []))
+    llm.reset()
+    comm.sent = []
+    start = time.perf_counter()
+    error = None
+    try:
+        agent.process_inbound_communication(dict(record["communication"]))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    latency_ms = (time.perf_counter() - start) * 1000
+    # Sends run off the turn's critical path; collect them for the decision, outside the latency.
+    agent.wait_for_deliveries()
+    # Appointment IDs differ between runs, so they are not part of the decision.
+    return {
+        "index": index,
+        "latency_ms": latency_ms,
+        "llm_calls": llm.calls,
+        "llm_tokens": llm.tokens,
+        "decision": {"intents": llm.intents, "outbound": [[channel, contact] for channel, contact, _ in comm.sent]},
+        "messages": comm.sent,
+        "error": error,
+    }
+
+
+def replay_config(config: Dict[str, Any], records: List[Dict[str, Any]], workers: int) -> List[Dict[str, Any]]:
+    """Replay all records under one configuration in a fresh process pool; results are in record order."""
+    # spawn, so each pool imports the agent modules afresh with this configuration's environment.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(config,)) as pool:
+        return list(pool.map(_replay_turn, range(len(records)), records))
+
+
+def summarize(name: str, results: List[Dict[str, Any]], baseline: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    latencies = sorted(r["latency_ms"] for r in results)
+    turns = len(results)
+    summary = {
+        "name": name,
+        "turns": turns,
+        "errors": sum(1 for r in results if r["error"]),
+        "latency_p50_ms": statistics.median(latencies) if latencies else 0.0,
+        "latency_p95_ms": latencies[min(turns - 1, int(turns * 0.95))] if latencies else 0.0,
+        "llm_calls_per_turn": sum(r["llm_calls"] for r in results) / max(turns, 1),
+        "llm_tokens_per_turn": sum(r["llm_tokens"] for r in results) / max(turns, 1),
+    }
+    if baseline is not None:
+        agreed = sum(1 for r, b in zip(results, baseline) if r["decision"] == b["decision"])
+        summary["decision_agreement"] = agreed / max(turns, 1)
+    return summary
+
+
+def load_records(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded conversations and compare configurations.")
+    parser.add_argument("recordings", help="JSONL file of recorded turns")
+    parser.add_argument("--configs", help="JSON file with a list of configurations (default: recorded vs mock)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", help="Write per-turn results and summaries to this JSON file")
+    args = parser.parse_args()
+
+    records = load_records(args.recordings)
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+
+    all_results, summaries, baseline = {}, [], None
+    for config in configs:
+        print(f"--- Replaying {len(records)} turns with '{config['name']}' ---")
+        results = replay_config(config, records, args.workers)
+        summaries.append(summarize(config["name"], results, baseline))
+        all_results[config["name"]] = results
+        baseline = baseline or results
+
+    print(f"\n{'config':<24} {'turns':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'calls/turn':>10} {'tokens/turn':>11} {'agreement':>9}")
+    for s in summaries:
+        agreement = f"{s['decision_agreement']:.1%}" if "decision_agreement" in s else "baseline"
+        print(f"{s['name']:<24} {s['turns']:>6} {s['errors']:>6} {s['latency_p50_ms']:>8.1f} {s['latency_p95_ms']:>8.1f} "
+              f"{s['llm_calls_per_turn']:>10.2f} {s['llm_tokens_per_turn']:>11.1f} {agreement:>9}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summaries": summaries, "results": all_results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
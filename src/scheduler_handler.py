@@ -1,24 +1,44 @@
 """
 Scheduler Handler module for the Dental Agent Prototype.
-This class provides a mocked interface for appointment scheduling system interactions.
+This class provides the interface for appointment scheduling system interactions, backed by
+an in-memory mock, a local SQLite appointment book, or Google Calendar (SCHEDULER_PROVIDER).
 """
 
+import dataclasses
+import json
 import os
-from typing import Dict
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from patient_directory import normalize_contact
+from records import Appointment, Patient
+from slot_reservations import SlotReservationTable, IdempotencyStore, to_epoch
 
 SCHEDULER_PROVIDER = os.getenv("SCHEDULER_PROVIDER", "mock").lower()
 
 if SCHEDULER_PROVIDER == "google":
     from google_calendar_handler import GoogleCalendarHandler
+elif SCHEDULER_PROVIDER == "sqlite":
+    from appointment_store import SQLiteAppointmentStore
 
 class SchedulerHandler:
     def __init__(self):
+        # Replay keys only need to outlive the process when the appointments they point to do.
+        # Only the mock scheduler accepts free-text times; the others need ISO 8601 start and end.
+        self.requires_exact_time = SCHEDULER_PROVIDER in ("google", "sqlite")
+        if self.requires_exact_time:
+            self.idempotency = IdempotencyStore()
+        else:
+            self.idempotency = IdempotencyStore(":memory:")
         if SCHEDULER_PROVIDER == "google":
             self.google_handler = GoogleCalendarHandler()
+            self.slot_holds = SlotReservationTable()
             print("SchedulerHandler using Google Calendar integration.")
+        elif SCHEDULER_PROVIDER == "sqlite":
+            self.store = SQLiteAppointmentStore()
+            print("SchedulerHandler using local SQLite appointment store.")
         else:
             print("SchedulerHandler initialized (Mock Mode).")
-            self.mock_schedule = {}  # Simple in-memory storage for mock appointments
+            self.mock_schedule: Dict[str, Appointment] = {}  # Simple in-memory storage for mock appointments
 
     def check_availability(self, requested_time: str, end_time: str = None) -> bool:
         if SCHEDULER_PROVIDER == "google":
@@ -26,52 +46,185 @@ class SchedulerHandler:
             if not end_time:
                 raise ValueError("end_time is required for Google Calendar scheduling.")
             return self.google_handler.check_availability(requested_time, end_time)
+        if SCHEDULER_PROVIDER == "sqlite":
+            if not end_time:
+                raise ValueError("end_time is required for SQLite scheduling.")
+            return self.store.check_availability(requested_time, end_time)
         print(f"SchedulerHandler (Mock): Checking availability for {requested_time}.")
         return True  # Mock always returns available
 
-    def book_appointment(self, patient_info: dict, time_slot: str, end_time: str = None) -> str:
+    def book_appointment(self, patient_info: dict, time_slot: str, end_time: str = None,
+                         idempotency_key: str = None) -> Optional[str]:
+        """
+        Book an appointment and return its ID, or None if the slot was taken in the meantime.
+
+        Calls with the same idempotency_key return the original appointment ID instead of booking again.
+        A key that was first used for a different slot raises ValueError rather than replaying.
+        """
+        if idempotency_key:
+            previous = self._replayed("book", idempotency_key, time_slot)
+            if previous:
+                print(f"SchedulerHandler: Replaying booking {previous} for idempotency key {idempotency_key}.")
+                return previous
         if SCHEDULER_PROVIDER == "google":
             if not end_time:
                 raise ValueError("end_time is required for Google Calendar scheduling.")
-            return self.google_handler.book_appointment(patient_info, time_slot, end_time)
-        print(f"SchedulerHandler (Mock): Booking appointment for {patient_info.get('name', 'Unknown')} at {time_slot}.")
-        appointment_id = f"APT{len(self.mock_schedule) + 1:05d}"
-        self.mock_schedule[appointment_id] = {
-            "patient_info": patient_info,
-            "time_slot": time_slot,
-            "status": "confirmed"
-        }
+            appointment_id = self._book_google(patient_info, time_slot, end_time, idempotency_key)
+        elif SCHEDULER_PROVIDER == "sqlite":
+            if not end_time:
+                raise ValueError("end_time is required for SQLite scheduling.")
+            appointment_id = self.store.book_appointment(patient_info, time_slot, end_time, idempotency_key)
+        else:
+            print(f"SchedulerHandler (Mock): Booking appointment for {patient_info.get('name', 'Unknown')} at {time_slot}.")
+            appointment_id = f"APT{len(self.mock_schedule) + 1:05d}"
+            self.mock_schedule[appointment_id] = Appointment(
+                appointment_id,
+                patient_name=patient_info.get("patient_name") or patient_info.get("name") or "Unknown",
+                patient_contact=normalize_contact(patient_info.get("contact") or patient_info.get("contact_info")),
+                time=time_slot,
+                end_time=end_time,
+                patient_info=patient_info,
+            )
+        if idempotency_key and appointment_id:
+            self._remember("book", idempotency_key, appointment_id, time_slot)
         return appointment_id
 
-    def modify_appointment(self, appointment_id: str, new_time_slot: str, new_end_time: str = None) -> bool:
+    def _replayed(self, action: str, idempotency_key: str, time_slot: str) -> Optional[str]:
+        """The appointment ID stored for this key, provided it was stored for the same slot."""
+        stored = self.idempotency.get(f"{action}:{idempotency_key}")
+        if not stored:
+            return None
+        stored = json.loads(stored)
+        if stored["slot"] != time_slot:
+            raise ValueError(f"Idempotency key {idempotency_key} was already used to {action} {stored['slot']}, "
+                             f"not {time_slot}.")
+        return stored["id"]
+
+    def _remember(self, action: str, idempotency_key: str, appointment_id: str, time_slot: str) -> None:
+        self.idempotency.put(f"{action}:{idempotency_key}", json.dumps({"id": appointment_id, "slot": time_slot}))
+
+    def _book_google(self, patient_info: dict, time_slot: str, end_time: str, idempotency_key: str = None) -> Optional[str]:
+        # A worker that timed out after the insert landed finds its own event here, before the
+        # availability re-check below would report the slot as taken.
+        if idempotency_key:
+            existing_id = self.google_handler.find_booking(idempotency_key)
+            if existing_id:
+                return existing_id
+        hold_id = self.slot_holds.acquire(time_slot, end_time)
+        if not hold_id:
+            return None
+        try:
+            # Re-check under the hold, uncoalesced: another worker may have booked since our caller checked.
+            if not self.google_handler.check_availability(time_slot, end_time, coalesce=False):
+                print(f"SchedulerHandler: {time_slot} was booked by another worker.")
+                return None
+            return self.google_handler.book_appointment(patient_info, time_slot, end_time, idempotency_key)
+        finally:
+            self.slot_holds.release(hold_id)
+
+    def modify_appointment(self, appointment_id: str, new_time_slot: str, new_end_time: str = None,
+                           idempotency_key: str = None, etag: str = None) -> bool:
+        if idempotency_key and self._replayed("modify", idempotency_key, new_time_slot):
+            print(f"SchedulerHandler: Modification for idempotency key {idempotency_key} already applied.")
+            return True
         if SCHEDULER_PROVIDER == "google":
             if not new_end_time:
                 raise ValueError("new_end_time is required for Google Calendar scheduling.")
-            return self.google_handler.modify_appointment(appointment_id, new_time_slot, new_end_time)
-        print(f"SchedulerHandler (Mock): Modifying appointment {appointment_id} to {new_time_slot}.")
-        if appointment_id in self.mock_schedule:
-            self.mock_schedule[appointment_id]["time_slot"] = new_time_slot
-            return True
-        return False
+            success = self._modify_google(appointment_id, new_time_slot, new_end_time, etag)
+        elif SCHEDULER_PROVIDER == "sqlite":
+            if not new_end_time:
+                raise ValueError("new_end_time is required for SQLite scheduling.")
+            success = self.store.modify_appointment(appointment_id, new_time_slot, new_end_time)
+        else:
+            print(f"SchedulerHandler (Mock): Modifying appointment {appointment_id} to {new_time_slot}.")
+            success = appointment_id in self.mock_schedule
+            if success:
+                self.mock_schedule[appointment_id] = dataclasses.replace(
+                    self.mock_schedule[appointment_id], time=new_time_slot, end_time=new_end_time,
+                    start_ts=None, end_ts=None
+                )
+        if idempotency_key and success:
+            self._remember("modify", idempotency_key, appointment_id, new_time_slot)
+        return success
+
+    def _modify_google(self, appointment_id: str, new_time_slot: str, new_end_time: str, etag: str = None) -> bool:
+        hold_id = self.slot_holds.acquire(new_time_slot, new_end_time)
+        if not hold_id:
+            return False
+        try:
+            if not self.google_handler.check_availability(new_time_slot, new_end_time, exclude_event_id=appointment_id,
+                                                          coalesce=False):
+                print(f"SchedulerHandler: {new_time_slot} is no longer available.")
+                return False
+            return self.google_handler.modify_appointment(appointment_id, new_time_slot, new_end_time, etag=etag)
+        finally:
+            self.slot_holds.release(hold_id)
 
     def cancel_appointment(self, appointment_id: str) -> bool:
         if SCHEDULER_PROVIDER == "google":
             return self.google_handler.cancel_appointment(appointment_id)
+        if SCHEDULER_PROVIDER == "sqlite":
+            return self.store.cancel_appointment(appointment_id)
         print(f"SchedulerHandler (Mock): Cancelling appointment {appointment_id}.")
         if appointment_id in self.mock_schedule:
-            self.mock_schedule[appointment_id]["status"] = "cancelled"
+            self.mock_schedule[appointment_id].status = "cancelled"
             return True
         return False
 
-    def get_appointment_details(self, appointment_id: str) -> dict:
+    def get_appointment_details(self, appointment_id: str) -> Optional[Appointment]:
         if SCHEDULER_PROVIDER == "google":
-            return self.google_handler.get_appointment_details(appointment_id)
+            event = self.google_handler.get_appointment_details(appointment_id)
+            return Appointment.from_event(event) if event else None
+        if SCHEDULER_PROVIDER == "sqlite":
+            return self.store.get_appointment_details(appointment_id)
         print(f"SchedulerHandler (Mock): Fetching details for appointment {appointment_id}.")
-        if appointment_id in self.mock_schedule:
-            return {
-                "id": appointment_id,
-                "patient_name": self.mock_schedule[appointment_id]["patient_info"].get("name", "Unknown"),
-                "time": self.mock_schedule[appointment_id]["time_slot"],
-                "status": self.mock_schedule[appointment_id]["status"]
-            }
-        return {"id": appointment_id, "patient_name": "Unknown", "time": "Unknown", "status": "not_found"} 
\ No newline at end of file
+        return self.mock_schedule.get(appointment_id) or Appointment.not_found(appointment_id)
+
+    def list_appointments(self, start_time: str, end_time: str,
+                          status: Union[str, Sequence[str], None] = None) -> List[Appointment]:
+        """List appointments starting in [start_time, end_time) with any of the given statuses; the mock ignores the range."""
+        statuses = (status,) if isinstance(status, str) else status
+        if SCHEDULER_PROVIDER == "google":
+            appointments = (Appointment.from_event(event)
+                            for event in self.google_handler.list_appointments(start_time, end_time))
+            return [a for a in appointments if not statuses or a.status in statuses]
+        if SCHEDULER_PROVIDER == "sqlite":
+            return self.store.list_appointments(start_time, end_time, statuses)
+        print(f"SchedulerHandler (Mock): Listing appointments from {start_time} to {end_time}.")
+        return [a for a in self.mock_schedule.values() if not statuses or a.status in statuses]
+
+    def set_appointment_status(self, appointment_ids: list, status: str) -> int:
+        """Set the status of many appointments in one batched write; returns how many were updated."""
+        if SCHEDULER_PROVIDER == "google":
+            return self.google_handler.set_status(appointment_ids, status)
+        if SCHEDULER_PROVIDER == "sqlite":
+            return self.store.set_status(appointment_ids, status)
+        print(f"SchedulerHandler (Mock): Marking {len(appointment_ids)} appointments as {status}.")
+        updated = 0
+        for appointment_id in appointment_ids:
+            if appointment_id in self.mock_schedule:
+                self.mock_schedule[appointment_id].status = status
+                updated += 1
+        return updated
+
+    def list_patient_appointments(self, patient: Patient, start_time: str) -> List[Appointment]:
+        """List a directory patient's confirmed appointments from start_time on."""
+        contacts = patient.contacts
+        if SCHEDULER_PROVIDER == "google":
+            return [Appointment.from_event(event) for contact in contacts
+                    for event in self.google_handler.list_patient_appointments(contact, start_time)]
+        if SCHEDULER_PROVIDER == "sqlite":
+            return self.store.list_patient_appointments(contacts, start_time)
+        print(f"SchedulerHandler (Mock): Listing appointments for {patient.name or 'Unknown'}.")
+        return [a for a in self.mock_schedule.values() if a.status == "confirmed" and a.patient_contact in contacts]
+
+    def get_busy_intervals(self, start_time: str, end_time: str) -> List[Tuple[float, float]]:
+        """Return busy periods overlapping [start_time, end_time) as (start, end) epoch seconds."""
+        if SCHEDULER_PROVIDER == "google":
+            return [(to_epoch(start), to_epoch(end))
+                    for start, end in self.google_handler.get_busy_intervals(start_time, end_time)]
+        if SCHEDULER_PROVIDER == "sqlite":
+            return self.store.get_busy_intervals(start_time, end_time)
+        # Mock appointments only have a start time, which may be free text; they never block a slot.
+        print(f"SchedulerHandler (Mock): Fetching busy intervals from {start_time} to {end_time}.")
+        return []
@@ -0,0 +1,84 @@
+"""
+Single Flight module for the Dental Agent Prototype.
+This class coalesces identical concurrent requests: the first caller for a key makes the upstream
+call and every caller that arrives while it is in flight waits for and shares its result.
+Nothing is cached once the call finishes.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+
+def make_key(*parts: Any, **params: Any) -> str:
+    """Build a coalescing key from strings (whitespace- and case-normalized) and call parameters."""
+    normalized = [re.sub(r"\s+", " ", part).strip().lower() if isinstance(part, str) else part for part in parts]
+    payload = json.dumps([normalized, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self, name: str = "single_flight"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._async_calls: Dict[tuple, asyncio.Future] = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run fn for key, or wait for the identical call already in flight and return its result."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.stats["calls"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            # Re-raises the leader's exception too, so followers see the same failure.
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Asyncio counterpart of do(); calls are coalesced per event loop."""
+        loop = asyncio.get_running_loop()
+        loop_key = (id(loop), key)
+        future = self._async_calls.get(loop_key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            # shield() so one follower being cancelled does not cancel the shared call.
+            return await asyncio.shield(future)
+        future = loop.create_future()
+        self._async_calls[loop_key] = future
+        self.stats["calls"] += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved so asyncio does not warn when nobody else was waiting.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._async_calls[loop_key]
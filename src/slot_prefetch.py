@@ -0,0 +1,149 @@
+"""
+Slot Prefetch module for the Dental Agent Prototype.
+This module loads the practice's busy periods for the next few days in the background when a
+conversation starts. Availability checks and slot offers later in the conversation are then
+answered locally instead of waiting on the calendar.
+
+A snapshot is only a hint: bookings still re-check the slot with the scheduler, so a slot taken
+after the snapshot was loaded is caught at booking time. Bookings made through this process are
+added to the shared snapshot, and a snapshot the scheduler contradicts is dropped.
+"""
+
+import bisect
+import datetime
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import pytz
+
+PREFETCH_DAYS = int(os.getenv("PREFETCH_DAYS", "3"))
+PREFETCH_TTL_SECONDS = float(os.getenv("PREFETCH_TTL_SECONDS", "60"))
+PRACTICE_TIMEZONE = os.getenv("PRACTICE_TIMEZONE", "America/New_York")
+PRACTICE_OPEN_HOUR = int(os.getenv("PRACTICE_OPEN_HOUR", "9"))
+PRACTICE_CLOSE_HOUR = int(os.getenv("PRACTICE_CLOSE_HOUR", "17"))
+APPOINTMENT_DURATION_MINUTES = int(os.getenv("APPOINTMENT_DURATION_MINUTES", "30"))
+
+
+class AvailabilitySnapshot:
+    def __init__(self, start_ts: float, end_ts: float, busy: List[Tuple[float, float]]):
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        # Busy periods and their starts, replaced together so concurrent readers never see a mismatch.
+        busy = sorted(busy)
+        self._busy = (busy, [start for start, _ in busy])
+        self._lock = threading.Lock()
+        self.fetched_at = time.time()
+
+    @property
+    def busy(self) -> List[Tuple[float, float]]:
+        return self._busy[0]
+
+    def mark_busy(self, start_ts: float, end_ts: float) -> None:
+        """Record a period booked since the snapshot was loaded."""
+        with self._lock:
+            busy = sorted(self._busy[0] + [(start_ts, end_ts)])
+            self._busy = (busy, [start for start, _ in busy])
+
+    def is_fresh(self, ttl_seconds: float = PREFETCH_TTL_SECONDS) -> bool:
+        return time.time() - self.fetched_at < ttl_seconds
+
+    def covers(self, start_ts: float, end_ts: float) -> bool:
+        return self.start_ts <= start_ts and end_ts <= self.end_ts
+
+    def is_available(self, start_ts: float, end_ts: float) -> Optional[bool]:
+        """Whether [start_ts, end_ts) is free, or None if the slot is outside the snapshot window."""
+        if not self.covers(start_ts, end_ts):
+            return None
+        busy, busy_starts = self._busy
+        # Only busy periods starting before end_ts can overlap; check those from the right.
+        i = bisect.bisect_left(busy_starts, end_ts)
+        return not any(busy_end > start_ts for _, busy_end in busy[:i])
+
+    def free_slots(self, after_ts: Optional[float] = None, count: int = 3,
+                   duration_minutes: int = APPOINTMENT_DURATION_MINUTES) -> List[Tuple[str, str]]:
+        """The next `count` free slots within practice hours, as (start, end) ISO strings."""
+        tz = pytz.timezone(PRACTICE_TIMEZONE)
+        duration = datetime.timedelta(minutes=duration_minutes)
+        cursor = datetime.datetime.fromtimestamp(max(after_ts or self.start_ts, self.start_ts), tz)
+        # Round up to the next slot boundary.
+        cursor = cursor.replace(second=0, microsecond=0)
+        cursor += datetime.timedelta(minutes=-cursor.minute % duration_minutes)
+        slots = []
+        while len(slots) < count and cursor.timestamp() + duration.total_seconds() <= self.end_ts:
+            start, end = cursor, cursor + duration
+            if (start.weekday() < 5 and start.hour >= PRACTICE_OPEN_HOUR
+                    and (end.hour, end.minute) <= (PRACTICE_CLOSE_HOUR, 0)
+                    and self.is_available(start.timestamp(), end.timestamp())):
+                slots.append((start.isoformat(), end.isoformat()))
+            cursor = tz.normalize(cursor + duration)
+        return slots
+
+
+class SlotPrefetcher:
+    def __init__(self, scheduler_handler, days: int = PREFETCH_DAYS, ttl_seconds: float = PREFETCH_TTL_SECONDS,
+                 max_workers: int = 4):
+        self.scheduler_handler = scheduler_handler
+        self.days = days
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="slot-prefetch")
+        self._lock = threading.Lock()
+        self._latest: Optional[Future] = None
+
+    def prefetch(self) -> Future:
+        """
+        Start loading the next `days` of busy periods in the background and return the Future.
+
+        While a fetch is running or its snapshot is still fresh, conversations share it instead of
+        starting another calendar query.
+        """
+        with self._lock:
+            latest = self._latest
+            if latest is not None and (not latest.done() or (
+                    latest.exception() is None and latest.result().is_fresh(self.ttl_seconds))):
+                return latest
+            self._latest = self._executor.submit(self._load)
+            return self._latest
+
+    def invalidate(self, future: Optional[Future]) -> None:
+        """Stop sharing a snapshot the scheduler contradicted; the next prefetch loads a new one."""
+        with self._lock:
+            if self._latest is future:
+                self._latest = None
+
+    def _load(self) -> AvailabilitySnapshot:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        end = now + datetime.timedelta(days=self.days)
+        busy = self.scheduler_handler.get_busy_intervals(now.isoformat(), end.isoformat())
+        print(f"SlotPrefetcher: Loaded {len(busy)} busy periods for the next {self.days} days.")
+        return AvailabilitySnapshot(now.timestamp(), end.timestamp(), busy)
+
+
+def parse_practice_time(iso_time: str) -> datetime.datetime:
+    """Parse an ISO 8601 time; one without an offset is taken as practice-local (PRACTICE_TIMEZONE)."""
+    parsed = datetime.datetime.fromisoformat(iso_time.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        # Not the server's timezone, which is usually UTC: "2 PM" from a patient means 2 PM at the practice.
+        parsed = pytz.timezone(PRACTICE_TIMEZONE).localize(parsed)
+    return parsed
+
+
+def describe_slot(start_time: str) -> str:
+    """A speakable form of a slot start, e.g. 'Tuesday 9:30 AM'."""
+    start = datetime.datetime.fromisoformat(start_time).astimezone(pytz.timezone(PRACTICE_TIMEZONE))
+    return start.strftime("%A %I:%M %p").replace(" 0", " ")
+
+
+def snapshot_from(future: Optional[Future], timeout: float = 0.0) -> Optional[AvailabilitySnapshot]:
+    """The snapshot behind a prefetch Future if it is ready within timeout (and did not fail), else None."""
+    if future is None:
+        return None
+    try:
+        return future.result(timeout=timeout)
+    except Exception as e:
+        if not future.done():
+            return None
+        print(f"SlotPrefetcher: Prefetch failed, falling back to the scheduler: {e}")
+        return None
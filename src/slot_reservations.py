@@ -0,0 +1,148 @@
+"""
+Slot Reservation module for the Dental Agent Prototype.
+This module provides a local SQLite lock table of short-lived slot holds and a record of
+idempotency keys, so several workers can book against the same calendar without
+double-booking a slot or inserting the same appointment twice on a retry.
+"""
+
+import datetime
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from typing import Optional
+
+SLOT_HOLD_DB_PATH = os.getenv("SLOT_HOLD_DB_PATH", "slot_holds.db")
+SLOT_HOLD_TTL_SECONDS = float(os.getenv("SLOT_HOLD_TTL_SECONDS", "30"))
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+
+
+def to_epoch(iso_time: str) -> float:
+    """Convert an ISO8601 timestamp (with offset or 'Z') to epoch seconds."""
+    return datetime.datetime.fromisoformat(iso_time.replace("Z", "+00:00")).timestamp()
+
+
+# SQLite connections must not be used across fork(), so pre-fork servers reconnect every live
+# table in the child. One hook for all of them; a hook per instance would keep each one alive.
+_live_tables: "weakref.WeakSet[_SQLiteTable]" = weakref.WeakSet()
+
+
+def _reconnect_after_fork() -> None:
+    for table in list(_live_tables):
+        table._connect()
+
+
+os.register_at_fork(after_in_child=_reconnect_after_fork)
+
+
+class _SQLiteTable:
+    """Shared connection handling for the small lock tables kept in SLOT_HOLD_DB_PATH."""
+
+    SCHEMA = ""
+
+    def __init__(self, db_path: str = SLOT_HOLD_DB_PATH):
+        self.db_path = db_path
+        self._connect()
+        _live_tables.add(self)
+
+    def _connect(self) -> None:
+        self._lock = threading.Lock()
+        # isolation_level=None lets us issue BEGIN IMMEDIATE ourselves, which takes the
+        # database write lock up front and serializes check-and-insert across processes.
+        self._conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        if self.db_path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        # Also creates the tables in a forked child's fresh in-memory database.
+        self._conn.executescript(self.SCHEMA)
+
+
+class SlotReservationTable(_SQLiteTable):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS slot_holds (
+            hold_id TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            start_ts REAL NOT NULL,
+            end_ts REAL NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_slot_holds_range ON slot_holds (start_ts, end_ts);
+    """
+
+    def __init__(self, db_path: str = SLOT_HOLD_DB_PATH, ttl_seconds: float = SLOT_HOLD_TTL_SECONDS):
+        super().__init__(db_path)
+        self.ttl_seconds = ttl_seconds
+        print(f"SlotReservationTable initialized ({db_path}, ttl={ttl_seconds}s).")
+
+    def acquire(self, start_time: str, end_time: str, holder: Optional[str] = None) -> Optional[str]:
+        """
+        Place a short TTL hold on [start_time, end_time).
+
+        Returns the hold ID, or None if an unexpired hold from another holder overlaps the slot.
+        """
+        start_ts, end_ts = to_epoch(start_time), to_epoch(end_time)
+        holder = holder or f"{os.getpid()}:{threading.get_ident()}"
+        now = time.time()
+        hold_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM slot_holds WHERE expires_at <= ?", (now,))
+                conflict = self._conn.execute(
+                    "SELECT holder FROM slot_holds WHERE start_ts < ? AND end_ts > ? AND holder != ? LIMIT 1",
+                    (end_ts, start_ts, holder)
+                ).fetchone()
+                if conflict:
+                    self._conn.execute("ROLLBACK")
+                    print(f"SlotReservationTable: {start_time} - {end_time} is held by {conflict[0]}.")
+                    return None
+                self._conn.execute(
+                    "INSERT INTO slot_holds (hold_id, holder, start_ts, end_ts, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (hold_id, holder, start_ts, end_ts, now + self.ttl_seconds)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return hold_id
+
+    def release(self, hold_id: str) -> None:
+        """Release a hold early; holds that are never released simply expire."""
+        with self._lock:
+            self._conn.execute("DELETE FROM slot_holds WHERE hold_id = ?", (hold_id,))
+
+
+class IdempotencyStore(_SQLiteTable):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str = SLOT_HOLD_DB_PATH, ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS):
+        super().__init__(db_path)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the recorded result for an idempotency key, if it has not expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM idempotency_keys WHERE key = ? AND created_at > ?",
+                (key, time.time() - self.ttl_seconds)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, result: str) -> None:
+        """Record the result of an operation; the first recorded result wins."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM idempotency_keys WHERE key = ? AND created_at <= ?",
+                (key, time.time() - self.ttl_seconds)
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO idempotency_keys (key, result, created_at) VALUES (?, ?, ?)",
+                (key, result, time.time())
+            )
@@ -0,0 +1,109 @@
+"""
+TTS Cache module for the Dental Agent Prototype.
+This class synthesizes speech with ElevenLabs and stores the audio on disk under the SHA-256 of
+(voice, model, text), so each distinct phrase is synthesized once and then served from disk.
+The cache is bounded by file count and age; the oldest files are removed when a new one is written.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import time
+from typing import Iterable, Optional
+
+import requests
+
+ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
+ELEVENLABS_TTS_MODEL = os.getenv("ELEVENLABS_TTS_MODEL", "eleven_multilingual_v2")
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MAX_FILES = int(os.getenv("TTS_CACHE_MAX_FILES", "2000"))
+TTS_CACHE_MAX_AGE_DAYS = float(os.getenv("TTS_CACHE_MAX_AGE_DAYS", "30"))
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class TTSCache:
+    def __init__(self, cache_dir: str = TTS_CACHE_DIR, api_key: Optional[str] = ELEVENLABS_API_KEY,
+                 voice_id: str = ELEVENLABS_VOICE_ID, model_id: str = ELEVENLABS_TTS_MODEL,
+                 max_files: int = TTS_CACHE_MAX_FILES, max_age_days: float = TTS_CACHE_MAX_AGE_DAYS):
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+        self.max_age_seconds = max_age_days * 86400
+        self.api_key = api_key
+        self.voice_id = voice_id
+        self.model_id = model_id
+        os.makedirs(cache_dir, exist_ok=True)
+        print(f"TTSCache initialized ({cache_dir}, {'ElevenLabs' if api_key else 'disabled: no API key'}).")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key)
+
+    def digest(self, text: str) -> str:
+        return hashlib.sha256(f"{self.voice_id}\0{self.model_id}\0{text}".encode("utf-8")).hexdigest()
+
+    def path_for_digest(self, digest: str) -> Optional[str]:
+        """Return the cached audio file for a digest, or None if the digest is invalid or not cached."""
+        if not DIGEST_PATTERN.match(digest):
+            return None
+        path = os.path.join(self.cache_dir, f"{digest}.mp3")
+        return path if os.path.exists(path) else None
+
+    def get_or_synthesize(self, text: str) -> Optional[str]:
+        """Return the digest of the audio for text, synthesizing it on a cache miss; None if unavailable."""
+        digest = self.digest(text)
+        if self.path_for_digest(digest):
+            return digest
+        if not self.enabled:
+            return None
+        audio = self._synthesize(text)
+        if audio is None:
+            return None
+        # Write to a temp file and rename, so concurrent workers never serve a partial file.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, os.path.join(self.cache_dir, f"{digest}.mp3"))
+        self.prune()
+        return digest
+
+    def warm(self, phrases: Iterable[str]) -> int:
+        """Pre-synthesize phrases (e.g. at startup); returns how many are now cached."""
+        self.prune()
+        return sum(1 for phrase in phrases if self.get_or_synthesize(phrase))
+
+    def prune(self) -> int:
+        """Remove files older than the maximum age, then the oldest beyond the maximum count; returns how many."""
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".mp3"):
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass  # Removed by another worker
+        files.sort(reverse=True)
+        cutoff = time.time() - self.max_age_seconds
+        expired = [path for i, (mtime, path) in enumerate(files) if mtime < cutoff or i >= self.max_files]
+        for path in expired:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return len(expired)
+
+    def _synthesize(self, text: str) -> Optional[bytes]:
+        try:
+            response = requests.post(
+                f"https://api.elevenlabs.io/v1/text-to-speech/{self.voice_id}",
+                headers={"xi-api-key": self.api_key, "accept": "audio/mpeg"},
+                json={"text": text, "model_id": self.model_id},
+                timeout=30
+            )
+            if response.status_code == 200:
+                return response.content
+            print(f"ElevenLabs TTS error: {response.text}")
+        except Exception as e:
+            print(f"Error in ElevenLabs synthesis: {e}")
+        return None
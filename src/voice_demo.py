@@ -1,28 +1,132 @@
 import os
-from flask import Flask, request, Response, url_for
+from flask import Flask, request, Response, url_for, send_file, abort, jsonify, g
 from twilio.twiml.voice_response import VoiceResponse
 import requests
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from message_templates import render, render_chunks, static_phrases
+from patient_directory import get_patient_directory
+from profiler import PROFILE_HEADER, profile_requested, should_profile, start_profile, finish_profile, profiled
+from tts_cache import TTSCache
+
 app = Flask(__name__)
 
 # Config
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
+# Hand transcripts to the DentalAgent (needs LLM credentials); off by default for the demo.
+VOICE_USE_AGENT = os.getenv("VOICE_USE_AGENT", "0") == "1"
+# Append each agent turn (inbound message and LLM responses) here for offline replay (src/replay.py).
+REPLAY_RECORD_PATH = os.getenv("REPLAY_RECORD_PATH")
+
+tts_cache = TTSCache()
+agent = None
+
+def warm_shared_state():
+    """
+    Load read-only state before workers are forked: cached phrase audio and the patient index.
+
+    Under a pre-fork server these pages are inherited copy-on-write, so every worker shares them.
+    """
+    tts_cache.warm(static_phrases())
+    if VOICE_USE_AGENT:
+        get_patient_directory().load()
+
+def init_agent():
+    """Build the DentalAgent and its handlers once for this worker process."""
+    global agent
+    if not VOICE_USE_AGENT or agent is not None:
+        return
+    from main import get_llm_handler
+    from scheduler_handler import SchedulerHandler
+    from communication_handler import CommunicationHandler
+    from agent_core import DentalAgent
+    llm = get_llm_handler()
+    if REPLAY_RECORD_PATH:
+        from replay import RecordingLLMHandler
+        llm = RecordingLLMHandler(llm, REPLAY_RECORD_PATH)
+    agent = DentalAgent(llm, SchedulerHandler(), CommunicationHandler())
+
+def handle_transcript(communication_input):
+    """Pass a transcribed message to the agent, recording the turn when REPLAY_RECORD_PATH is set."""
+    if REPLAY_RECORD_PATH:
+        with agent.llm_handler.recording(communication_input):
+            agent.process_inbound_communication(communication_input)
+    else:
+        agent.process_inbound_communication(communication_input)
+
+@app.before_request
+def start_request_profile():
+    """Profile this request if PROFILE_HEADER carries PROFILE_TOKEN or its call is sampled (PROFILE_SAMPLE_RATE)."""
+    forced = profile_requested(request.headers.get(PROFILE_HEADER))
+    if not forced and request.endpoint not in ("voice", "recording"):
+        return
+    call_sid = request.form.get("CallSid")
+    if should_profile(call_sid, forced):
+        g.profile = start_profile(f"{request.method} {request.path}", call_sid)
+
+@app.teardown_request
+def finish_request_profile(exc):
+    profile = g.pop("profile", None)
+    if profile:
+        finish_profile(*profile)
+
+@profiled("voice.speak")
+def speak(resp, message_type, **values):
+    """
+    Add a templated message to the response, playing cached ElevenLabs audio when available.
+
+    Only the fixed template text is synthesized and cached. The variable parts (transcripts, names,
+    times) can carry patient information, so they are spoken with Twilio's voice and never leave
+    the call or land on disk.
+    """
+    if tts_cache.enabled:
+        chunks = render_chunks(message_type, **values)
+        digests = [tts_cache.get_or_synthesize(text) if fixed else None for text, fixed in chunks]
+        if all(digest for digest, (_, fixed) in zip(digests, chunks) if fixed):
+            for (text, fixed), digest in zip(chunks, digests):
+                if fixed:
+                    resp.play(url_for('tts_audio', digest=digest, _external=True))
+                else:
+                    resp.say(text, voice='alice')
+            return
+    resp.say(render(message_type, **values), voice='alice')
+
+@app.route("/tts/<digest>.mp3", methods=["GET"])
+def tts_audio(digest):
+    """Serve synthesized audio from the TTS cache."""
+    path = tts_cache.path_for_digest(digest)
+    if not path:
+        abort(404)
+    return send_file(path, mimetype='audio/mpeg', max_age=31536000)
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return "ok"
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Per-process LLM rate limiter metrics (queue depth, in-flight calls, concurrency limit) and delivery counts."""
+    from llm.rate_limiter import get_rate_limit_metrics
+    return jsonify({
+        "pid": os.getpid(),
+        "llm_rate_limits": get_rate_limit_metrics(),
+        "deliveries": agent.delivery_stats() if agent is not None else None,
+    })
 
 @app.route("/voice", methods=["POST"])
 def voice():
     """Handle incoming call: prompt for a message and record it."""
     resp = VoiceResponse()
-    resp.say("Hello! Please leave a message after the beep. Press any key when done.", voice='alice')
+    speak(resp, "leave_message")
     resp.record(
         action=url_for('recording', _external=True),
         max_length=30,
         finish_on_key="#"
     )
-    resp.say("We did not receive a recording. Goodbye!", voice='alice')
+    speak(resp, "no_recording")
     return Response(str(resp), mimetype='text/xml')
 
 @app.route("/recording", methods=["POST"])
@@ -33,14 +137,23 @@ def recording():
     print(f"Received recording from {caller}: {recording_url}")
     transcript = transcribe_with_elevenlabs(recording_url)
     print(f"Transcript: {transcript}")
+    if transcript and agent is not None:
+        handle_transcript({
+            "caller_id": caller,
+            "message": transcript,
+            "call_sid": request.form.get("CallSid"),
+            # One recording per turn, so Twilio's retries of this webhook share it.
+            "message_id": request.form.get("RecordingSid"),
+        })
     resp = VoiceResponse()
     if transcript:
-        resp.say(f"You said: {transcript}", voice='alice')
+        speak(resp, "you_said", transcript=transcript)
     else:
-        resp.say("Sorry, we could not transcribe your message.", voice='alice')
+        speak(resp, "transcription_failed")
     resp.hangup()
     return Response(str(resp), mimetype='text/xml')
 
+@profiled("voice.transcribe")
 def transcribe_with_elevenlabs(recording_url):
     """Download the recording and send to ElevenLabs for transcription."""
     if not ELEVENLABS_API_KEY:
@@ -71,4 +184,7 @@ def transcribe_with_elevenlabs(recording_url):
         return None
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True) 
\ No newline at end of file
+    # Development server only; see gunicorn_conf.py for the multi-process serving mode.
+    warm_shared_state()
+    init_agent()
+    app.run(host="0.0.0.0", port=5000, debug=os.getenv("FLASK_DEBUG", "0") == "1") 
\ No newline at end of file
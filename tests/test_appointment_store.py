@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from appointment_store import SQLiteAppointmentStore
+
+START = "2026-10-20T09:00:00-04:00"
+END = "2026-10-20T09:30:00-04:00"
+PATIENT = {"patient_name": "Ada", "contact": "555-0100"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    # A file database: each thread gets its own connection, and :memory: is per connection.
+    return SQLiteAppointmentStore(str(tmp_path / "appointments.db"))
+
+
+def test_overlapping_booking_is_refused(store):
+    assert store.book_appointment(PATIENT, START, END) is not None
+    assert store.book_appointment(PATIENT, "2026-10-20T09:15:00-04:00", "2026-10-20T09:45:00-04:00") is None
+    assert not store.check_availability(START, END)
+
+
+def test_adjacent_booking_and_cancelled_slot_are_free(store):
+    first = store.book_appointment(PATIENT, START, END)
+    assert store.book_appointment(PATIENT, END, "2026-10-20T10:00:00-04:00") is not None
+    store.cancel_appointment(first)
+    assert store.book_appointment(PATIENT, START, END) is not None
+
+
+def test_idempotency_key_replays_original_booking(store):
+    first = store.book_appointment(PATIENT, START, END, idempotency_key="req-1")
+    assert store.book_appointment(PATIENT, START, END, idempotency_key="req-1") == first
+
+
+def test_concurrent_bookings_of_one_slot_book_once(store):
+    results = []
+    barrier = threading.Barrier(8)
+
+    def book():
+        barrier.wait()
+        results.append(store.book_appointment(PATIENT, START, END))
+
+    threads = [threading.Thread(target=book) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len([r for r in results if r]) == 1
+    assert len(store.list_appointments(START, END, "confirmed")) == 1
+
+
+def test_list_appointments_filters_on_several_statuses(store):
+    kept = store.book_appointment(PATIENT, START, END)
+    missed = store.book_appointment(PATIENT, END, "2026-10-20T10:00:00-04:00")
+    cancelled = store.book_appointment(PATIENT, "2026-10-20T10:00:00-04:00", "2026-10-20T10:30:00-04:00")
+    store.set_status([missed], "no_show")
+    store.cancel_appointment(cancelled)
+    listed = store.list_appointments(START, "2026-10-20T11:00:00-04:00", ("confirmed", "no_show"))
+    assert [a.id for a in listed] == [kept, missed]
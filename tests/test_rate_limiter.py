@@ -0,0 +1,105 @@
+import email.utils
+import time
+
+import pytest
+
+from llm.rate_limiter import (AIMDConcurrencyLimiter, RateLimiter, TokenBucket, _load_limits,
+                              retry_after_seconds)
+
+
+class _Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class _RateLimited(Exception):
+    def __init__(self, headers):
+        super().__init__("429")
+        self.response = _Response(headers)
+
+
+def test_reserve_is_free_within_capacity_then_waits_for_refill():
+    bucket = TokenBucket(rate_per_minute=60)  # One token per second, 60 banked.
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(2) == pytest.approx(2.0, abs=0.1)
+    # Waits accumulate: the next reservation queues behind the previous one.
+    assert bucket.reserve(1) == pytest.approx(3.0, abs=0.1)
+
+
+def test_reserve_caps_oversized_requests_at_capacity():
+    bucket = TokenBucket(rate_per_minute=60, capacity=10)
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.1)
+
+
+def test_adjust_charges_the_difference_after_the_fact():
+    bucket = TokenBucket(rate_per_minute=60)
+    bucket.reserve(30)
+    bucket.adjust(40)
+    assert bucket.reserve(1) == pytest.approx(11.0, abs=0.1)
+
+
+def test_aimd_increases_on_success_and_halves_on_throttle():
+    limiter = AIMDConcurrencyLimiter(max_limit=8, initial_limit=4)
+    limiter.acquire()
+    limiter.release(succeeded=True)
+    assert limiter.limit == pytest.approx(4.25)
+    limiter.acquire()
+    limiter.release(throttled=True, succeeded=False)
+    assert limiter.limit == pytest.approx(2.125)
+    assert limiter.in_flight == 0
+
+
+def test_aimd_ignores_other_errors_and_respects_bounds():
+    limiter = AIMDConcurrencyLimiter(max_limit=2, min_limit=1, initial_limit=2)
+    limiter.acquire()
+    limiter.release(succeeded=False)
+    assert limiter.limit == 2
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(succeeded=True)
+    assert limiter.limit == 2
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(throttled=True, succeeded=False)
+    assert limiter.limit == 1
+
+
+def test_load_limits_splits_budgets_between_processes(monkeypatch):
+    monkeypatch.setenv("LLM_RATE_LIMITS", '{"openai": {"rpm": 400}, "openai:gpt-4": {"tpm": 40000}}')
+    limits = _load_limits(processes=4)
+    assert limits["openai"]["rpm"] == 100
+    assert limits["openai"]["tpm"] == 7500
+    assert limits["openai"]["max_concurrency"] == 16
+    assert limits["openai:gpt-4"] == {"tpm": 10000}
+    assert _load_limits(processes=0)["gemini"]["rpm"] == 60
+
+
+def test_retry_after_seconds_and_ms():
+    assert retry_after_seconds(_RateLimited({"retry-after": "3"})) == 3.0
+    assert retry_after_seconds(_RateLimited({"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(Exception("no response")) is None
+
+
+def test_retry_after_http_date():
+    date = email.utils.formatdate(time.time() + 10, usegmt=True)
+    assert retry_after_seconds(_RateLimited({"retry-after": date})) == pytest.approx(10, abs=1.5)
+
+
+@pytest.mark.parametrize("value", ["soon", "Mon, 99 Foo 2026 25:61:00 GMT", "-"])
+def test_malformed_retry_after_is_ignored(value):
+    assert retry_after_seconds(_RateLimited({"retry-after": value})) is None
+
+
+def test_call_retries_with_plain_backoff_on_malformed_retry_after():
+    limiter = RateLimiter("test", [], [], AIMDConcurrencyLimiter(4), max_retries=2, backoff_base=0)
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise _RateLimited({"retry-after": "soon"})
+        return "ok"
+
+    assert limiter.call(fn, 10, lambda e: isinstance(e, _RateLimited)) == "ok"
+    assert limiter.stats["throttled"] == 1 and limiter.stats["retries"] == 1
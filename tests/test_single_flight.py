@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight, make_key
+
+CALLERS = 8
+
+
+def _wait_for_followers(flight, count):
+    deadline = time.time() + 5
+    while flight.stats["coalesced"] < count:
+        assert time.time() < deadline, "followers never joined the call in flight"
+        time.sleep(0.001)
+
+
+def _run_concurrently(flight, fn):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flight.do("key", fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "slots"
+
+    threads, results, errors = _run_concurrently(flight, fn)
+    _wait_for_followers(flight, CALLERS - 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ["slots"] * CALLERS and not errors
+    assert flight.stats == {"calls": 1, "coalesced": CALLERS - 1}
+
+
+def test_followers_see_the_leaders_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+    failure = RuntimeError("calendar unavailable")
+
+    def fn():
+        release.wait(5)
+        raise failure
+
+    threads, results, errors = _run_concurrently(flight, fn)
+    _wait_for_followers(flight, CALLERS - 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert not results
+    assert len(errors) == CALLERS and all(e is failure for e in errors)
+
+
+def test_finished_call_is_not_cached():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.stats == {"calls": 2, "coalesced": 0}
+
+
+def test_async_followers_survive_a_cancelled_follower():
+    flight = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "slots"
+
+    async def main():
+        leader = asyncio.create_task(flight.do_async("key", fn))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(flight.do_async("key", fn))
+        follower = asyncio.create_task(flight.do_async("key", fn))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return await leader, await follower
+
+    assert asyncio.run(main()) == ("slots", "slots")
+    assert len(calls) == 1
+
+
+def test_async_followers_see_the_leaders_exception():
+    flight = SingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("calendar unavailable")
+
+    async def main():
+        tasks = [asyncio.create_task(flight.do_async("key", fn)) for _ in range(3)]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.stats == {"calls": 1, "coalesced": 2}
+
+
+def test_make_key_normalizes_text():
+    assert make_key("Book  Tuesday\n2 PM", model="gpt") == make_key("book tuesday 2 pm", model="gpt")
+    assert make_key("book tuesday 2 pm", model="gpt") != make_key("book tuesday 2 pm", model="gemini")
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from scheduler_handler import SchedulerHandler
+from slot_reservations import SlotReservationTable
+
+START = "2026-10-20T09:00:00-04:00"
+END = "2026-10-20T09:30:00-04:00"
+
+
+@pytest.fixture
+def holds(tmp_path):
+    return SlotReservationTable(str(tmp_path / "holds.db"), ttl_seconds=30)
+
+
+def test_overlapping_hold_from_another_holder_is_refused(holds):
+    assert holds.acquire(START, END, holder="a") is not None
+    assert holds.acquire("2026-10-20T09:15:00-04:00", "2026-10-20T09:45:00-04:00", holder="b") is None
+
+
+def test_same_holder_and_adjacent_slots_are_not_conflicts(holds):
+    assert holds.acquire(START, END, holder="a") is not None
+    assert holds.acquire(START, END, holder="a") is not None
+    assert holds.acquire(END, "2026-10-20T10:00:00-04:00", holder="b") is not None
+
+
+def test_released_hold_frees_the_slot(holds):
+    hold_id = holds.acquire(START, END, holder="a")
+    holds.release(hold_id)
+    assert holds.acquire(START, END, holder="b") is not None
+
+
+def test_expired_hold_is_reaped(tmp_path):
+    holds = SlotReservationTable(str(tmp_path / "holds.db"), ttl_seconds=0.05)
+    assert holds.acquire(START, END, holder="a") is not None
+    time.sleep(0.1)
+    assert holds.acquire(START, END, holder="b") is not None
+    remaining = holds._conn.execute("SELECT holder FROM slot_holds").fetchall()
+    assert remaining == [("b",)]
+
+
+def test_repeated_idempotency_key_returns_original_appointment():
+    scheduler = SchedulerHandler()
+    patient = {"patient_name": "Ada", "contact": "555-0100"}
+    first = scheduler.book_appointment(patient, START, END, idempotency_key="req-1")
+    assert scheduler.book_appointment(patient, START, END, idempotency_key="req-1") == first
+    assert len(scheduler.mock_schedule) == 1
+
+
+def test_idempotency_key_reused_for_another_slot_raises():
+    scheduler = SchedulerHandler()
+    patient = {"patient_name": "Ada", "contact": "555-0100"}
+    scheduler.book_appointment(patient, START, END, idempotency_key="req-1")
+    with pytest.raises(ValueError):
+        scheduler.book_appointment(patient, "2026-10-20T10:00:00-04:00", "2026-10-20T10:30:00-04:00",
+                                   idempotency_key="req-1")
+    assert len(scheduler.mock_schedule) == 1